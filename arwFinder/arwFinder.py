@@ -1,30 +1,26 @@
 import os
-import shutil
-import exifread
 from tqdm import tqdm
 import logging
-from datetime import datetime, timedelta
+from datetime import timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import re
 from tabulate import tabulate
-from functools import lru_cache
 import time
+from fastExif import read_creation_date
+from copyBackend import COPY_MODES, copy_file
+from copyJournal import is_identical
+from metadataIndex import DEFAULT_INDEX_PATH, open_index
+from metadataCache import DEFAULT_MAX_ENTRIES, MetadataCache
+from workerState import BatchedLogWriter, ResultCollector
 
 # Logging configuration
 logging.basicConfig(filename="script.log", level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# LRU Cache for EXIF data to minimize disk reads
-@lru_cache(maxsize=None)
+# Bounded cache for EXIF data to minimize disk reads (header-only reader, exifread as fallback), keyed by path, size and mtime
+metadata_cache = MetadataCache(read_creation_date, DEFAULT_MAX_ENTRIES)
+
 def get_creation_date(file_path):
-    try:
-        with open(file_path, 'rb') as f:
-            tags = exifread.process_file(f)
-            date_tag = 'EXIF DateTimeOriginal'
-            if date_tag in tags:
-                return datetime.strptime(str(tags[date_tag]), '%Y:%m:%d %H:%M:%S')
-    except Exception as e:
-        logging.error(f"Error reading metadata from {file_path}: {e}")
-    return None
+    return metadata_cache.get(file_path)
 
 # Function to get the progressive number of the photo
 def get_base_name(file_name):
@@ -53,18 +49,28 @@ def get_user_input(prompt, default_value=None):
 
 # Function to find .arw files in SD card folders
 # CHECK IT AGAIN
-def find_arw_files(sd_folder):
+def find_arw_files(sd_folder, index=None):
     arw_files = {}
+    cached_rows = index.load_folder(sd_folder) if index is not None else None
     for root, _, files in os.walk(sd_folder):
         for file in files:
             if file.lower().endswith('.arw'):
                 arw_path = os.path.join(root, file)
-                creation_date = get_creation_date(arw_path)
-                base_name = get_base_name(file)
+                if index is not None:
+                    try:
+                        base_name, creation_date = index.get_or_parse(arw_path, os.stat(arw_path), get_creation_date, get_base_name, cached_rows)
+                    except OSError as e:
+                        logging.error(f"Error reading metadata from {arw_path}: {e}")
+                        continue
+                else:
+                    creation_date = get_creation_date(arw_path)
+                    base_name = get_base_name(file)
                 if creation_date and base_name: # Check that both are note None
                     if base_name not in arw_files:
                         arw_files[base_name] = []   # Initialize a new key
                     arw_files[base_name].append((arw_path, creation_date))
+    if index is not None:
+        index.commit()
     return arw_files
 
 # Function to find files with similar metadata
@@ -102,7 +108,7 @@ def get_user_confirmation(original_file, similar_files):
         print("Invalid choice. Please try again.")
         return get_user_confirmation(original_file, similar_files)
 
-def process_jpg_file(jpg_file, selected_jpg_folder, arw_files, output_folder, log_file, unmatched_files):
+def process_jpg_file(jpg_file, selected_jpg_folder, arw_files, output_folder, log_file, unmatched_files, copy_mode):
     jpg_path = os.path.join(selected_jpg_folder, jpg_file)
     jpg_creation_date = get_creation_date(jpg_path)
     base_name = get_base_name(jpg_file)
@@ -113,14 +119,17 @@ def process_jpg_file(jpg_file, selected_jpg_folder, arw_files, output_folder, lo
             arw_path = arw_file_list[0][0]
             output_path = os.path.join(output_folder, os.path.basename(arw_path))
             try:
-                shutil.copy2(arw_path, output_path)
-                logging.info(f"Copied {arw_path} to {output_path}")
+                if is_identical(os.stat(arw_path), output_path):
+                    logging.info(f"Skipped {arw_path}: {output_path} is already complete")
+                else:
+                    copy_file(arw_path, output_path, copy_mode)
+                    logging.info(f"Copied {arw_path} to {output_path}")
             except Exception as e:
                 log_message = f"Error copying {arw_path} to {output_path}: {e}\n"
                 log_file.write(log_message)
                 logging.error(log_message)
         else:
-            similar_files = find_similar_files(jpg_creation_date, arw_file_list)
+            similar_files = find_similar_files(jpg_creation_date, arw_file_list, max_time_difference=60)
             if similar_files:
                 unmatched_files.append((jpg_file, jpg_path, jpg_creation_date, similar_files))
             else:
@@ -133,7 +142,7 @@ def process_jpg_file(jpg_file, selected_jpg_folder, arw_files, output_folder, lo
         log_file.write(log_message)
         logging.warning(log_message)
 
-def handle_unmatched_files(unmatched_files, output_folder, log_file):
+def handle_unmatched_files(unmatched_files, output_folder, log_file, copy_mode):
     for jpg_file, jpg_path, jpg_creation_date, similar_files in unmatched_files:
         original_file = {
             'name': jpg_file,
@@ -144,8 +153,11 @@ def handle_unmatched_files(unmatched_files, output_folder, log_file):
         if arw_path:
             output_path = os.path.join(output_folder, os.path.basename(arw_path))
             try:
-                shutil.copy2(arw_path, output_path)
-                logging.info(f"Copied {arw_path} to {output_path} after user confirmation")
+                if is_identical(os.stat(arw_path), output_path):
+                    logging.info(f"Skipped {arw_path}: {output_path} is already complete")
+                else:
+                    copy_file(arw_path, output_path, copy_mode)
+                    logging.info(f"Copied {arw_path} to {output_path} after user confirmation")
             except Exception as e:
                 log_message = f"Error copying {arw_path} to {output_path}: {e}\n"
                 log_file.write(log_message)
@@ -161,6 +173,11 @@ def main():
     selected_jpg_folder = os.path.abspath(get_user_input("\nEnter the path to the folder containing the selected .jpg files"))
     sd_card_folders = [os.path.abspath(path) for path in get_user_input("\nEnter the paths to the SD card folders (separated by space)").split()]
     output_folder = os.path.abspath(get_user_input("\nEnter the path to the output folder for .arw files"))
+    index_path = get_user_input("\nEnter the path to the metadata index file ('none' to disable)", default_value=DEFAULT_INDEX_PATH)
+    copy_mode = get_user_input("\nEnter the copy mode (reflink/hardlink/copy/buffered)", default_value="reflink").lower()
+    while copy_mode not in COPY_MODES:
+        print(f"Unknown copy mode '{copy_mode}'. Choose one of: {', '.join(COPY_MODES)}")
+        copy_mode = get_user_input("\nEnter the copy mode (reflink/hardlink/copy/buffered)", default_value="reflink").lower()
 
     print("\nSummary of choices:")
     sd_folders_summary = "\n".join([f"{i + 1}. {folder}" for i, folder in enumerate(sd_card_folders)])
@@ -168,6 +185,8 @@ def main():
         ["Folder containing selected .jpg files", selected_jpg_folder],
         ["SD card folders", sd_folders_summary],
         ["Output folder for .arw files", output_folder],
+        ["Metadata index file", index_path],
+        ["Copy mode", copy_mode],
         ["Number of workers", num_workers]
     ]
 
@@ -186,42 +205,49 @@ def main():
 
     # Preload metadata for all .arw files using multiple threads
     print("\nPreloading metadata for .arw files...")
+    index = open_index(index_path)
     arw_files = {}
     with ThreadPoolExecutor(max_workers=num_workers) as executor:
-        futures = [executor.submit(find_arw_files, folder) for folder in sd_card_folders]
+        futures = [executor.submit(find_arw_files, folder, index) for folder in sd_card_folders]
         for future in tqdm(as_completed(futures), total=len(futures), desc="Preloading metadata", unit="folder"):
             result = future.result()
             for key, value in result.items():
                 if key not in arw_files:
                     arw_files[key] = []
                 arw_files[key].extend(value)
+    if index is not None:
+        print(f"Metadata index: {index.hits} unchanged files reused, {index.misses} files parsed")
+        index.close()
 
     # Get the list of selected .jpg files
     selected_jpg_files = [f for f in os.listdir(selected_jpg_folder) if f.lower().endswith('.jpg')]
     total_files = len(selected_jpg_files)
 
-    unmatched_files = []
+    # Shared by the worker threads: unmatched files are collected and log lines written in batches under a lock
+    unmatched_files = ResultCollector()
 
-    # Create a log file for .arw files not found
+    # Append to the log file for .arw files not found, so earlier runs stay on record
     log_file_path = os.path.join(output_folder, "log.txt")
-    with open(log_file_path, "w") as log_file:
-        log_file.write("Log of missing .arw files:\n\n")
+    with BatchedLogWriter(open(log_file_path, "a")) as log_file:
+        log_file.write(f"\nLog of missing .arw files (run started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time))}):\n\n")
         print("\nCopying corresponding .arw files to the output folder...")
 
         # Process files using the pool of workers
         with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = [executor.submit(process_jpg_file, jpg_file, selected_jpg_folder, arw_files, output_folder, log_file, unmatched_files)
+            futures = [executor.submit(process_jpg_file, jpg_file, selected_jpg_folder, arw_files, output_folder, log_file, unmatched_files, copy_mode)
                        for jpg_file in selected_jpg_files]
             for future in tqdm(as_completed(futures), total=len(futures), desc="Copying .arw files", unit="file"):
                 future.result()
 
-    total_elapsed_time = time.time() - start_time
-    completion_message = f"Automatic part completed in {total_elapsed_time:.2f} seconds. Check the log file for any issues. Eventual exceptions will now be processed"
-    print(completion_message)
-    logging.info(completion_message)
+        total_elapsed_time = time.time() - start_time
+        cache_stats = metadata_cache.stats()
+        print(f"Metadata cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['evictions']} evictions")
+        completion_message = f"Automatic part completed in {total_elapsed_time:.2f} seconds. Check the log file for any issues. Eventual exceptions will now be processed"
+        print(completion_message)
+        logging.info(completion_message)
 
-    # Handle unmatched files after initial processing
-    handle_unmatched_files(unmatched_files, output_folder, log_file)
+        # Handle unmatched files after initial processing, while the log file is still open
+        handle_unmatched_files(unmatched_files.drain(), output_folder, log_file, copy_mode)
 
 if __name__ == "__main__":
     main()
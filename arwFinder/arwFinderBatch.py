@@ -0,0 +1,92 @@
+import sys
+import signal
+import threading
+import argparse
+from copyBackend import COPY_MODES
+from copyScheduler import DEFAULT_MAX_INFLIGHT_MB, DEFAULT_READ_WORKERS, DEFAULT_WRITE_WORKERS
+from deviceScheduler import DEFAULT_PER_DEVICE_LIMIT
+from metadataIndex import DEFAULT_INDEX_PATH
+from metadataCache import DEFAULT_MAX_ENTRIES
+from perfReport import PROFILE_MODES
+from scanEngine import DEFAULT_SCAN_CONCURRENCY, SCAN_ENGINES
+from autoTune import DEFAULT_TUNING_PATH
+from arwFinder_highPerformance import apply_resolutions, run_job
+from selectionWatcher import DEFAULT_POLL_INTERVAL
+from watchMode import watch_selection
+
+# Library API: run_job() runs scanning, matching and copying end to end, apply_resolutions() copies the choices
+# recorded in a resolution file, watch_selection() keeps copying as .jpg files are selected. All return a summary dict.
+__all__ = ["run_job", "apply_resolutions", "watch_selection", "main"]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Copy the .arw files matching a selection of .jpg files, without prompts")
+    parser.add_argument("--jpg-folder", help="Folder containing the selected .jpg files")
+    parser.add_argument("--sd-folders", nargs="+", help="SD card folders to search for .arw files")
+    parser.add_argument("--output", help="Output folder for .arw files")
+    parser.add_argument("--apply-resolutions", metavar="FILE", help="Copy the choices recorded in a resolution file instead of scanning")
+    parser.add_argument("--resolutions", metavar="FILE", help="Where to write ambiguous matches (.json or .csv; default: <output>/resolutions.json)")
+    parser.add_argument("--workers", type=int, default=8, help="Workers for scanning and preview hashing")
+    parser.add_argument("--engine", choices=SCAN_ENGINES, default="thread", help="Scanning engine")
+    parser.add_argument("--scan-concurrency", type=int, default=DEFAULT_SCAN_CONCURRENCY, help="Concurrent reads per device with the async engine")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Metadata index file ('none' to disable)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_ENTRIES, help="Maximum files kept in the in-memory metadata cache")
+    parser.add_argument("--copy-mode", choices=COPY_MODES, default="reflink", help="How .arw files are copied")
+    parser.add_argument("--read-workers", type=int, default=DEFAULT_READ_WORKERS, help="Concurrent reads from the SD cards")
+    parser.add_argument("--write-workers", type=int, default=DEFAULT_WRITE_WORKERS, help="Concurrent writes to the output folder")
+    parser.add_argument("--max-inflight-mb", type=int, default=DEFAULT_MAX_INFLIGHT_MB, help="Maximum MB of .arw data in flight")
+    parser.add_argument("--per-device-limit", type=int, default=DEFAULT_PER_DEVICE_LIMIT, help="Concurrent scans/reads per device")
+    parser.add_argument("--autotune", action="store_true", help="Choose the scanning engine and the scan/copy concurrency from measured throughput")
+    parser.add_argument("--retune", action="store_true", help="Like --autotune, but sample again instead of using remembered settings")
+    parser.add_argument("--tuning-file", default=DEFAULT_TUNING_PATH, help="Where tuned settings are remembered per device")
+    parser.add_argument("--no-auto-resolve", action="store_true", help="Do not resolve ambiguous matches with preview hashes")
+    parser.add_argument("--verify", action="store_true", help="Verify every copy with a checksum")
+    parser.add_argument("--watch", action="store_true", help="Keep running and copy the .arw file of every .jpg added to the selection folder")
+    parser.add_argument("--remove-on-delete", action="store_true", help="In watch mode, remove the copied .arw file when its .jpg is deleted")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, help="Seconds between folder scans when inotify is unavailable")
+    parser.add_argument("--polling", action="store_true", help="Watch by polling even where inotify is available (e.g. network shares)")
+    parser.add_argument("--report", metavar="FILE", help="Where to write the JSON performance report (default: <output>/performance_report.json)")
+    parser.add_argument("--profile", choices=PROFILE_MODES, help="Profile the run with cProfile or tracemalloc (files written next to the report)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    copy_options = dict(copy_mode=args.copy_mode, read_workers=args.read_workers, write_workers=args.write_workers,
+                        max_inflight_mb=args.max_inflight_mb, per_device_limit=args.per_device_limit, verify=args.verify,
+                        autotune=args.autotune, tuning_path=args.tuning_file, retune=args.retune)
+
+    if args.apply_resolutions:
+        summary = apply_resolutions(args.apply_resolutions, args.output, report_path=args.report, **copy_options)
+        print(f"Applied {summary['resolved']} resolutions: {summary['copied']} copied, {summary['skipped']} skipped, "
+              f"{summary['failed']} failed, {summary['unresolved']} without a choice")
+        return 1 if summary["failed"] else 0
+
+    if not (args.jpg_folder and args.sd_folders and args.output):
+        parser.error("--jpg-folder, --sd-folders and --output are required unless --apply-resolutions is given")
+    if args.watch:
+        # SIGTERM (e.g. from a service manager) stops the watch loop cleanly, like Ctrl+C
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+        summary = watch_selection(args.jpg_folder, args.sd_folders, args.output, num_workers=args.workers,
+                                  scan_engine=args.engine, index_path=args.index, auto_resolve=not args.no_auto_resolve,
+                                  remove_on_delete=args.remove_on_delete, poll_interval=args.poll_interval,
+                                  force_polling=args.polling, resolution_path=args.resolutions, cache_size=args.cache_size,
+                                  report_path=args.report, stop_event=stop_event, scan_concurrency=args.scan_concurrency,
+                                  **copy_options)
+        print(f"{summary['selected']} selected, {summary['copied']} copied, {summary['removed']} removed, "
+              f"{summary['failed']} failed, {summary['missing']} missing, {summary['ambiguous']} ambiguous")
+        return 1 if summary["failed"] else 0
+
+    summary = run_job(args.jpg_folder, args.sd_folders, args.output, num_workers=args.workers, scan_engine=args.engine,
+                      index_path=args.index, auto_resolve=not args.no_auto_resolve, interactive=False,
+                      resolution_path=args.resolutions, cache_size=args.cache_size, report_path=args.report, profile=args.profile,
+                      scan_concurrency=args.scan_concurrency, **copy_options)
+    print(f"{summary['copied']} copied, {summary['skipped']} skipped, {summary['failed']} failed, "
+          f"{summary['missing']} missing, {summary['ambiguous']} ambiguous")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
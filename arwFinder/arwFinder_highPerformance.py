@@ -1,30 +1,39 @@
 import os
-import shutil
-import exifread
 from tqdm import tqdm
 import logging
-from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import re
 from tabulate import tabulate
-from functools import lru_cache
 import time
+from fastExif import read_creation_date
+from metadataIndex import DEFAULT_INDEX_PATH, open_index
+from metadataCache import DEFAULT_MAX_ENTRIES, MetadataCache
+from workerState import BatchedLogWriter
+from perfReport import DEFAULT_REPORT_FILE_NAME, PROFILE_FILE_PREFIX, PerfReport, format_report, profile_session
+from scanEngine import DEFAULT_SCAN_CONCURRENCY, SCAN_ENGINES, scan_folders_async, scan_folders_process
+from copyBackend import COPY_MODES, copy_file
+from copyScheduler import DEFAULT_MAX_INFLIGHT_MB, DEFAULT_READ_WORKERS, DEFAULT_WRITE_WORKERS, CopyScheduler
+from deviceScheduler import DEFAULT_PER_DEVICE_LIMIT, device_of, run_per_device
+from copyJournal import PARTIAL_SUFFIX, CopyJournal, assign_output_paths, cleanup_partial_files
+from integrity import HASH_NAME, Manifest, VerificationError, copy_with_hash, discard_checksums, verify_file
+from previewHash import is_available as preview_hash_available, resolve_ambiguous
+from resolutionFile import DEFAULT_RESOLUTION_FILE_NAME, read_resolution_file, write_resolution_file
+from joinEngine import build_arw_index, plan_matches
+from autoTune import DEFAULT_TUNING_PATH, AutoTuner
 
 # Logging configuration
 logging.basicConfig(filename="script.log", level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# LRU Cache for EXIF data to minimize disk reads
-@lru_cache(maxsize=None)
+# Bounded cache for EXIF data to minimize disk reads (header-only reader, exifread as fallback), keyed by path, size and mtime
+metadata_cache = MetadataCache(read_creation_date, DEFAULT_MAX_ENTRIES)
+
+# Per-stage timings of the current run, written as a JSON report at the end
+perf_report = PerfReport()
+
 def get_creation_date(file_path):
-    try:
-        with open(file_path, 'rb') as f:
-            tags = exifread.process_file(f)
-            date_tag = 'EXIF DateTimeOriginal'
-            if date_tag in tags:
-                return datetime.strptime(str(tags[date_tag]), '%Y:%m:%d %H:%M:%S')
-    except Exception as e:
-        logging.error(f"Error reading metadata from {file_path}: {e}")
-    return None
+    start = time.perf_counter()
+    creation_date = metadata_cache.get(file_path)
+    perf_report.record_file("exif", file_path, time.perf_counter() - start)
+    return creation_date
 
 # Function to get the progressive number of the photo
 def get_base_name(file_name):
@@ -52,40 +61,30 @@ def get_user_input(prompt, default_value=None):
     return value
 
 # Function to find .arw files in SD card folders
-def find_arw_files(sd_folder):
+def find_arw_files(sd_folder, index=None):
+    start = time.perf_counter()
     arw_files = []
+    cached_rows = index.load_folder(sd_folder) if index is not None else None
     for root, _, files in os.walk(sd_folder):
         for file in files:
             if file.lower().endswith('.arw'):
                 arw_path = os.path.join(root, file)
-                creation_date = get_creation_date(arw_path)
-                base_name = get_base_name(file)
-                if creation_date and base_name:
+                if index is not None:
+                    try:
+                        base_name, creation_date = index.get_or_parse(arw_path, os.stat(arw_path), get_creation_date, get_base_name, cached_rows)
+                    except OSError as e:
+                        logging.error(f"Error reading metadata from {arw_path}: {e}")
+                        continue
+                else:
+                    creation_date = get_creation_date(arw_path)
+                    base_name = get_base_name(file)
+                if creation_date:
                     arw_files.append((base_name, arw_path, creation_date))
+    if index is not None:
+        index.commit()
+    perf_report.record_file("scan", sd_folder, time.perf_counter() - start, count=False)
     return arw_files
 
-# Function to process a batch of .arw files
-def process_arw_batch(arw_files, selected_jpg_files, selected_jpg_folder, output_folder, log_file, unmatched_files):
-    arw_dict = {}
-    for base_name, arw_path, creation_date in arw_files:
-        if base_name not in arw_dict:
-            arw_dict[base_name] = []
-        arw_dict[base_name].append((arw_path, creation_date))
-
-    for jpg_file in selected_jpg_files:
-        process_jpg_file(jpg_file, selected_jpg_folder, arw_dict, output_folder, log_file, unmatched_files)
-
-# Function to find files with similar metadata
-def find_similar_files(target_date, arw_file_list, max_time_difference):
-    similar_files = []
-    time_threshold = timedelta(seconds=max_time_difference)
-    for arw_path, creation_date in arw_file_list:
-        time_difference = abs(creation_date - target_date)
-        if time_difference <= time_threshold:
-            similar_files.append((arw_path, creation_date, time_difference.total_seconds()))
-    similar_files.sort(key=lambda x: x[2])  # Sort by time difference
-    return similar_files
-
 def get_user_confirmation(original_file, similar_files):
     print(f"\nOriginal file: {original_file['name']}, Path: {original_file['path']}, Shooting time: {original_file['time']}\n")
     print("Multiple similar files found:")
@@ -110,41 +109,59 @@ def get_user_confirmation(original_file, similar_files):
         print("Invalid choice. Please try again.")
         return get_user_confirmation(original_file, similar_files)
 
-def process_jpg_file(jpg_file, selected_jpg_folder, arw_dict, output_folder, log_file, unmatched_files):
-    jpg_path = os.path.join(selected_jpg_folder, jpg_file)
-    jpg_creation_date = get_creation_date(jpg_path)
-    base_name = get_base_name(jpg_file)
-
-    if base_name in arw_dict:
-        arw_file_list = arw_dict[base_name]
-        if len(arw_file_list) == 1:
-            arw_path = arw_file_list[0][0]
-            output_path = os.path.join(output_folder, os.path.basename(arw_path))
-            try:
-                with open(arw_path, 'rb') as source_file:
-                    file_data = source_file.read()
-                with open(output_path, 'wb') as dest_file:
-                    dest_file.write(file_data)
-                logging.info(f"Copied {arw_path} to {output_path}")
-            except Exception as e:
-                log_message = f"Error copying {arw_path} to {output_path}: {e}\n"
-                log_file.write(log_message)
-                logging.error(log_message)
+# Function to copy a matched .arw file to the output folder
+def copy_matched_file(arw_path, output_folder, log_file, copy_mode, journal=None, manifest=None, reason=""):
+    output_path = assign_output_paths([arw_path], output_folder, journal)[0]
+    partial_path = output_path + PARTIAL_SUFFIX
+    verify = manifest is not None
+    try:
+        source_stat = os.stat(arw_path)
+        if journal is not None and journal.is_done(arw_path, output_path, source_stat, require_verified=verify):
+            logging.info(f"Skipped {arw_path}: {output_path} is already complete")
+            return
+        if verify:
+            method = "buffered"
+            file_hash = copy_with_hash(arw_path, partial_path)
+            # The copy only gets its final name once its checksum matched
+            if not verify_file(partial_path, file_hash):
+                raise VerificationError(f"Checksum mismatch after copying to {output_path}")
+            os.replace(partial_path, output_path)
+            manifest.add(output_path, file_hash)
         else:
-            similar_files = find_similar_files(jpg_creation_date, arw_file_list, max_time_difference=60)
-            if similar_files:
-                unmatched_files.append((jpg_file, jpg_path, jpg_creation_date, similar_files))
-            else:
-                log_message = f"No similar .arw files found for {jpg_file}\n"
-                print(log_message)
-                log_file.write(log_message)
-                logging.warning(log_message)
-    else:
-        log_message = f".arw file not found for {jpg_file} with creation date {jpg_creation_date}\n"
+            file_hash = None
+            method = copy_file(arw_path, partial_path, copy_mode)
+            os.replace(partial_path, output_path)
+            discard_checksums(output_folder, [output_path])
+        if journal is not None:
+            journal.record(arw_path, output_path, source_stat, file_hash, method=method, verified=verify)
+        logging.info(f"Copied {arw_path} to {output_path} ({method}){reason}")
+    except Exception as e:
+        if os.path.lexists(partial_path):
+            os.remove(partial_path)
+        log_message = f"Error copying {arw_path} to {output_path}: {e}\n"
+        log_file.write(log_message)
+        logging.error(log_message)
+
+# Function to log the outcome of the copy scheduler
+def log_copy_results(copy_results, log_file):
+    for result in copy_results:
+        if result.method == "skipped":
+            logging.info(f"Skipped {result.source_path}: {result.output_path} is already complete")
+        elif result.error is None:
+            logging.info(f"Copied {result.source_path} to {result.output_path} ({result.method})")
+        else:
+            log_message = f"Error copying {result.source_path} to {result.output_path}: {result.error}\n"
+            log_file.write(log_message)
+            logging.error(log_message)
+
+# Function to log the .jpg files of the match plan without a usable .arw candidate
+def log_missing_files(missing_files, log_file):
+    for jpg_file, jpg_path, jpg_creation_date, reason in missing_files:
+        log_message = f"{reason}\n"
         log_file.write(log_message)
         logging.warning(log_message)
 
-def handle_unmatched_files(unmatched_files, output_folder, log_file):
+def handle_unmatched_files(unmatched_files, output_folder, log_file, copy_mode, journal=None, manifest=None):
     for jpg_file, jpg_path, jpg_creation_date, similar_files in unmatched_files:
         original_file = {
             'name': jpg_file,
@@ -153,40 +170,267 @@ def handle_unmatched_files(unmatched_files, output_folder, log_file):
         }
         arw_path = get_user_confirmation(original_file, similar_files)
         if arw_path:
-            output_path = os.path.join(output_folder, os.path.basename(arw_path))
-            try:
-                with open(arw_path, 'rb') as source_file:
-                    file_data = source_file.read()
-                with open(output_path, 'wb') as dest_file:
-                    dest_file.write(file_data)
-                logging.info(f"Copied {arw_path} to {output_path} after user confirmation")
-            except Exception as e:
-                log_message = f"Error copying {arw_path} to {output_path}: {e}\n"
-                log_file.write(log_message)
-                logging.error(log_message)
+            copy_matched_file(arw_path, output_folder, log_file, copy_mode, journal, manifest, reason=" after user confirmation")
         else:
             log_message = f"No valid .arw file found for {jpg_file} after user confirmation\n"
             log_file.write(log_message)
             logging.error(log_message)
 
-def estimate_memory_usage(batch_size, avg_file_size_mb=24):
-    return batch_size * avg_file_size_mb / 1024
+# Function to preload metadata for all .arw files using multiple threads (one per folder), worker processes (chunks of
+# files) or asyncio (many concurrent directory listings and header reads, for network and USB mounts)
+def scan_arw_files(sd_card_folders, num_workers, scan_engine="thread", index=None, per_device_limit=DEFAULT_PER_DEVICE_LIMIT,
+                   scan_concurrency=DEFAULT_SCAN_CONCURRENCY):
+    # The .arw metadata stream is collected as each folder (or chunk) completes, then indexed by capture time
+    arw_files = []
+    with perf_report.stage("scan"):
+        _scan_arw_files(arw_files, sd_card_folders, num_workers, scan_engine, index, per_device_limit, scan_concurrency)
+    perf_report.add("scan", files=len(arw_files), engine=scan_engine, folders=len(sd_card_folders))
+    return arw_files
+
+def _scan_arw_files(arw_files, sd_card_folders, num_workers, scan_engine, index, per_device_limit, scan_concurrency):
+    if scan_engine == "process":
+        arw_files.extend(scan_folders_process(sd_card_folders, get_base_name, num_workers, index))
+    elif scan_engine == "async":
+        arw_files.extend(scan_folders_async(sd_card_folders, get_base_name, scan_concurrency, index, parse_date=get_creation_date))
+    else:
+        # Folders are scanned round-robin across devices, with at most per_device_limit folders per device at once
+        with tqdm(total=len(sd_card_folders), desc="Preloading metadata", unit="folder") as progress:
+            def on_folder_done(folder, result):
+                arw_files.extend(result)
+                progress.update(1)
+            run_per_device(sd_card_folders, device_of, lambda folder: find_arw_files(folder, index), num_workers, per_device_limit, on_folder_done)
+
+# Function to choose the scanning engine and concurrency with the autotuner; without one the given settings are kept.
+# Returns (scan_engine, num_workers, per_device_limit, scan_concurrency).
+def autotune_scan(tuner, sd_card_folders, scan_engine, num_workers, per_device_limit, scan_concurrency):
+    if tuner is None:
+        return scan_engine, num_workers, per_device_limit, scan_concurrency
+    with perf_report.stage("autotune"):
+        tuned = tuner.tune_scan(sd_card_folders, get_creation_date, scan_engine, num_workers, per_device_limit, scan_concurrency)
+    return tuned["engine"], tuned["num_workers"], tuned["per_device_limit"], tuned["scan_concurrency"]
+
+# Function to match the selected .jpg files against the scanned .arw files, optionally settling ambiguities by preview hash
+def build_match_plan(arw_files, selected_jpg_folder, num_workers, auto_resolve=True, index=None):
+    # Get the list of selected .jpg files and match all of them against the capture-time index in one batch
+    selected_jpg_files = [f for f in os.listdir(selected_jpg_folder) if f.lower().endswith('.jpg')]
+    with perf_report.stage("match"):
+        plan = plan_matches(build_arw_index(arw_files), selected_jpg_files, selected_jpg_folder, get_creation_date, get_base_name)
+    perf_report.add("match", files=len(selected_jpg_files), arw_files=len(arw_files), unique=len(plan.unique),
+                    ambiguous=len(plan.ambiguous), missing=len(plan.missing))
+    print(f"\nMatch plan: {len(plan.unique)} unique, {len(plan.ambiguous)} ambiguous, {len(plan.missing)} missing")
+
+    # Compare embedded .arw previews with the selected .jpg to settle ambiguous matches without asking the user
+    if plan.ambiguous and auto_resolve:
+        print("\nResolving ambiguous matches with preview hashes...")
+        ambiguous_count = len(plan.ambiguous)
+        with perf_report.stage("preview_hash"):
+            resolved, plan.ambiguous = resolve_ambiguous(plan.ambiguous, num_workers, index)
+        perf_report.add("preview_hash", files=ambiguous_count, resolved=len(resolved))
+        for jpg_file, jpg_path, jpg_creation_date, arw_path, distance in resolved:
+            logging.info(f"Matched {jpg_file} to {arw_path} automatically (preview hash distance {distance})")
+            plan.unique.append((jpg_file, jpg_path, jpg_creation_date, arw_path))
+        print(f"Resolved {len(resolved)} automatically, {len(plan.ambiguous)} left for confirmation")
+    return plan
+
+# Function to copy a list of .arw files to the output folder with the copy scheduler; returns the CopyResults
+def copy_arw_files(arw_paths, output_folder, log_file, copy_mode="reflink", read_workers=DEFAULT_READ_WORKERS,
+                   write_workers=DEFAULT_WRITE_WORKERS, max_inflight_mb=DEFAULT_MAX_INFLIGHT_MB,
+                   per_device_limit=DEFAULT_PER_DEVICE_LIMIT, journal=None, manifest=None, tuner=None):
+    # Each source is copied once (two .jpg files can match the same .arw file), to an output path of its own
+    arw_paths = list(dict.fromkeys(arw_paths))
+    copy_jobs = list(zip(arw_paths, assign_output_paths(arw_paths, output_folder, journal)))
+
+    def run_batch(jobs, batch_read_workers, batch_write_workers, batch_per_device_limit, desc="Copying .arw files (tuning)"):
+        scheduler = CopyScheduler(copy_mode, max_inflight_mb * 1024 * 1024, batch_read_workers, batch_write_workers,
+                                  per_device_limit=batch_per_device_limit, journal=journal, verify=manifest is not None,
+                                  manifest=manifest)
+        return scheduler.run(jobs, desc=desc)
+
+    with perf_report.stage("copy"):
+        copy_results = []
+        if tuner is not None:
+            # The first files are copied with increasing concurrency; the rest with the best one found
+            (read_workers, write_workers, per_device_limit), copy_results, copy_jobs = tuner.tune_copy(
+                copy_jobs, output_folder, run_batch, read_workers, write_workers, per_device_limit)
+        if copy_jobs:
+            copy_results += run_batch(copy_jobs, read_workers, write_workers, per_device_limit, desc="Copying .arw files")
+    copied = [result for result in copy_results if result.error is None and result.method != "skipped"]
+    if manifest is None:
+        discard_checksums(output_folder, [result.output_path for result in copied])
+    for result in copied:
+        perf_report.record_file("copy", result.source_path, result.seconds or 0.0, count=False)
+    perf_report.add("copy", files=len(copied), bytes=sum(result.size for result in copied), copy_mode=copy_mode,
+                    skipped=len(copy_results) - len(copied) - sum(1 for result in copy_results if result.error is not None))
+    log_copy_results(copy_results, log_file)
+    skipped_count = sum(1 for result in copy_results if result.method == "skipped")
+    if skipped_count:
+        print(f"Skipped {skipped_count} files already completed by a previous run")
+    if manifest is not None:
+        verified_count = sum(1 for result in copy_results if result.verified)
+        print(f"Verified {verified_count} copies, checksums written to {manifest.manifest_path}")
+    return copy_results
+
+# Function to open the output folder for a run: resume state (journal, partial files), manifest and log file
+def open_output_folder(output_folder, verify, start_time):
+    # Create output folder if it does not exist
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    # Resume support: drop partial files of an interrupted run and load the journal of completed copies
+    cleanup_partial_files(output_folder)
+    journal = CopyJournal(output_folder)
+    manifest = Manifest(output_folder) if verify else None
+
+    # Append to the log file for .arw files not found, so earlier runs stay on record
+    log_file = BatchedLogWriter(open(os.path.join(output_folder, "log.txt"), "a"))
+    log_file.write(f"\nLog of missing .arw files (run started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time))}):\n\n")
+    return journal, manifest, log_file
+
+# Function to write the performance report of the current run and print its per-stage table
+def write_perf_report(report_path):
+    cache_stats = metadata_cache.stats()
+    perf_report.set_cache("metadata_cache", cache_stats["hits"], cache_stats["misses"], evictions=cache_stats["evictions"],
+                          entries=cache_stats["entries"], max_entries=cache_stats["max_entries"])
+    perf_report.write(report_path)
+    print(f"\n{format_report(perf_report.to_dict())}\nPerformance report written to {report_path}")
+    return report_path
+
+# Function to run scanning, matching and copying end to end. Ambiguous matches are either confirmed interactively
+# or, with interactive=False, written to a resolution file for a later apply_resolutions pass.
+# A JSON performance report is written to report_path (default: in the output folder); profile enables cProfile or
+# tracemalloc for the whole run. With autotune, the scanning engine and the scan and copy concurrency are chosen from
+# throughput sampled at the start of the run (or remembered per device in tuning_path; retune samples again).
+# Returns a summary dict with the counts of each outcome.
+def run_job(selected_jpg_folder, sd_card_folders, output_folder, num_workers=8, scan_engine="thread",
+            index_path=DEFAULT_INDEX_PATH, copy_mode="reflink", read_workers=DEFAULT_READ_WORKERS,
+            write_workers=DEFAULT_WRITE_WORKERS, max_inflight_mb=DEFAULT_MAX_INFLIGHT_MB,
+            per_device_limit=DEFAULT_PER_DEVICE_LIMIT, auto_resolve=True, verify=False, interactive=False,
+            resolution_path=None, cache_size=DEFAULT_MAX_ENTRIES, report_path=None, profile=None,
+            scan_concurrency=DEFAULT_SCAN_CONCURRENCY, autotune=False, tuning_path=DEFAULT_TUNING_PATH, retune=False):
+    if scan_engine not in SCAN_ENGINES:
+        raise ValueError(f"Unknown scanning engine '{scan_engine}'. Choose one of: {', '.join(SCAN_ENGINES)}")
+    if copy_mode not in COPY_MODES:
+        raise ValueError(f"Unknown copy mode '{copy_mode}'. Choose one of: {', '.join(COPY_MODES)}")
+    selected_jpg_folder = os.path.abspath(selected_jpg_folder)
+    sd_card_folders = [os.path.abspath(folder) for folder in sd_card_folders]
+    output_folder = os.path.abspath(output_folder)
+    metadata_cache.resize(cache_size)
+    perf_report.reset()
+    tuner = AutoTuner(tuning_path, retune) if autotune or retune else None
+    with profile_session(profile, os.path.join(output_folder, PROFILE_FILE_PREFIX), perf_report):
+        summary = _run_job(selected_jpg_folder, sd_card_folders, output_folder, num_workers, scan_engine, index_path,
+                           copy_mode, read_workers, write_workers, max_inflight_mb, per_device_limit, auto_resolve,
+                           verify, interactive, resolution_path, scan_concurrency, tuner)
+    if tuner is not None:
+        summary["tuning"] = tuner.decisions
+        perf_report.add("autotune", **tuner.decisions)
+    summary["report_file"] = write_perf_report(report_path or os.path.join(output_folder, DEFAULT_REPORT_FILE_NAME))
+    return summary
+
+def _run_job(selected_jpg_folder, sd_card_folders, output_folder, num_workers, scan_engine, index_path, copy_mode,
+             read_workers, write_workers, max_inflight_mb, per_device_limit, auto_resolve, verify, interactive,
+             resolution_path, scan_concurrency, tuner):
+    start_time = time.time()
+    journal, manifest, log_file = open_output_folder(output_folder, verify, start_time)
+
+    # Copies keep per_device_limit unless the copy tuning changes it; the scan may use its own
+    scan_engine, num_workers, scan_per_device_limit, scan_concurrency = autotune_scan(
+        tuner, sd_card_folders, scan_engine, num_workers, per_device_limit, scan_concurrency)
+    print("\nPreloading metadata for .arw files...")
+    index = open_index(index_path)
+    arw_files = scan_arw_files(sd_card_folders, num_workers, scan_engine, index, scan_per_device_limit, scan_concurrency)
+    if index is not None:
+        print(f"Metadata index: {index.hits} unchanged files reused, {index.misses} files parsed")
+        perf_report.set_cache("metadata_index", index.hits, index.misses)
+    plan = build_match_plan(arw_files, selected_jpg_folder, num_workers, auto_resolve and preview_hash_available(), index)
+    if index is not None:
+        index.close()
+    cache_stats = metadata_cache.stats()
+    print(f"Metadata cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['evictions']} evictions")
+
+    summary = {"unique": len(plan.unique), "ambiguous": len(plan.ambiguous), "missing": len(plan.missing),
+               "copied": 0, "skipped": 0, "failed": 0, "resolution_file": None, "report_file": None}
+    with log_file:
+        log_missing_files(plan.missing, log_file)
+        print("\nCopying corresponding .arw files to the output folder...")
+        copy_results = copy_arw_files([arw_path for _, _, _, arw_path in plan.unique], output_folder, log_file, copy_mode,
+                                      read_workers, write_workers, max_inflight_mb, per_device_limit, journal, manifest, tuner)
+        summary["copied"] = sum(1 for result in copy_results if result.error is None and result.method != "skipped")
+        summary["skipped"] = sum(1 for result in copy_results if result.method == "skipped")
+        summary["failed"] = sum(1 for result in copy_results if result.error is not None)
+
+        total_elapsed_time = time.time() - start_time
+        completion_message = f"Automatic part completed in {total_elapsed_time:.2f} seconds. Check the log file for any issues."
+        if interactive:
+            completion_message += " Eventual exceptions will now be processed"
+            print(completion_message)
+            logging.info(completion_message)
+            # Handle unmatched files after initial processing
+            handle_unmatched_files(plan.ambiguous, output_folder, log_file, copy_mode, journal, manifest)
+        else:
+            print(completion_message)
+            logging.info(completion_message)
+            if plan.ambiguous:
+                summary["resolution_file"] = resolution_path or os.path.join(output_folder, DEFAULT_RESOLUTION_FILE_NAME)
+                write_resolution_file(summary["resolution_file"], plan.ambiguous, output_folder)
+                print(f"{len(plan.ambiguous)} ambiguous matches written to {summary['resolution_file']}")
+    journal.close()
+    return summary
+
+# Function to copy the choices recorded in a resolution file, without rescanning the SD cards
+def apply_resolutions(resolution_path, output_folder=None, copy_mode="reflink", read_workers=DEFAULT_READ_WORKERS,
+                      write_workers=DEFAULT_WRITE_WORKERS, max_inflight_mb=DEFAULT_MAX_INFLIGHT_MB,
+                      per_device_limit=DEFAULT_PER_DEVICE_LIMIT, verify=False, report_path=None, autotune=False,
+                      tuning_path=DEFAULT_TUNING_PATH, retune=False):
+    recorded_output_folder, choices, unresolved = read_resolution_file(resolution_path)
+    output_folder = os.path.abspath(output_folder or recorded_output_folder)
+    perf_report.reset()
+    tuner = AutoTuner(tuning_path, retune) if autotune or retune else None
+    journal, manifest, log_file = open_output_folder(output_folder, verify, time.time())
+    with log_file:
+        for jpg_file in unresolved:
+            log_message = f"No choice recorded for {jpg_file} in {resolution_path}\n"
+            log_file.write(log_message)
+            logging.warning(log_message)
+        copy_results = copy_arw_files([arw_path for _, arw_path in choices], output_folder, log_file, copy_mode,
+                                      read_workers, write_workers, max_inflight_mb, per_device_limit, journal, manifest, tuner)
+    journal.close()
+    return {"resolved": len(choices), "unresolved": len(unresolved),
+            "copied": sum(1 for result in copy_results if result.error is None and result.method != "skipped"),
+            "skipped": sum(1 for result in copy_results if result.method == "skipped"),
+            "failed": sum(1 for result in copy_results if result.error is not None),
+            "report_file": write_perf_report(report_path or os.path.join(output_folder, DEFAULT_REPORT_FILE_NAME))}
 
 def main():
+    autotune = get_user_input("\nTune the scanning engine and concurrency automatically? (y/n)", default_value="n").lower() == 'y'
     num_workers = int(get_user_input("\nEnter the number of workers to use for parallel processing", default_value="8"))
+    scan_engine = get_user_input("\nEnter the scanning engine (thread/process/async)", default_value="thread").lower()
+    while scan_engine not in SCAN_ENGINES:
+        print(f"Unknown scanning engine '{scan_engine}'. Choose one of: {', '.join(SCAN_ENGINES)}")
+        scan_engine = get_user_input("\nEnter the scanning engine (thread/process/async)", default_value="thread").lower()
+    scan_concurrency = DEFAULT_SCAN_CONCURRENCY
+    if scan_engine == "async":
+        scan_concurrency = int(get_user_input("\nEnter the number of concurrent reads per SD card for the async scan",
+                                              default_value=str(DEFAULT_SCAN_CONCURRENCY)))
 
     selected_jpg_folder = os.path.abspath(get_user_input("\nEnter the path to the folder containing the selected .jpg files"))
     sd_card_folders = [os.path.abspath(path) for path in get_user_input("\nEnter the paths to the SD card folders (separated by space)").split()]
     output_folder = os.path.abspath(get_user_input("\nEnter the path to the output folder for .arw files"))
-
-    default_batch_size = 4 * 1024 // 24  # Default batch size for ~4GB memory usage
-    batch_size = int(get_user_input(f"\nEnter the batch size (number of files) to load into memory", default_value=default_batch_size))
-    estimated_memory_usage = estimate_memory_usage(batch_size)
-
-    print(f"\nEstimated memory usage for batch size {batch_size}: {estimated_memory_usage:.2f} GB")
-    confirm_batch_size = input("Do you want to proceed with this batch size? (y/n): ")
-    if confirm_batch_size.lower() != 'y':
-        batch_size = int(get_user_input("\nEnter the desired batch size"))
+    index_path = get_user_input("\nEnter the path to the metadata index file ('none' to disable)", default_value=DEFAULT_INDEX_PATH)
+    copy_mode = get_user_input("\nEnter the copy mode (reflink/hardlink/copy/buffered)", default_value="reflink").lower()
+    while copy_mode not in COPY_MODES:
+        print(f"Unknown copy mode '{copy_mode}'. Choose one of: {', '.join(COPY_MODES)}")
+        copy_mode = get_user_input("\nEnter the copy mode (reflink/hardlink/copy/buffered)", default_value="reflink").lower()
+    read_workers = int(get_user_input("\nEnter the number of concurrent reads from the SD cards", default_value=str(DEFAULT_READ_WORKERS)))
+    write_workers = int(get_user_input("\nEnter the number of concurrent writes to the output folder", default_value=str(DEFAULT_WRITE_WORKERS)))
+    max_inflight_mb = int(get_user_input("\nEnter the maximum MB of .arw data in flight while copying", default_value=str(DEFAULT_MAX_INFLIGHT_MB)))
+    per_device_limit = int(get_user_input("\nEnter the maximum concurrent scans/reads per SD card device", default_value=str(DEFAULT_PER_DEVICE_LIMIT)))
+    auto_resolve = False
+    if preview_hash_available():
+        auto_resolve = get_user_input("\nResolve ambiguous matches automatically with preview hashes? (y/n)", default_value="y").lower() == 'y'
+    else:
+        print("\nPillow is not installed: ambiguous matches will be confirmed manually.")
+    verify = get_user_input(f"\nVerify every copy with a {HASH_NAME} checksum? (y/n)", default_value="n").lower() == 'y'
 
     print("\nSummary of choices:")
     sd_folders_summary = "\n".join([f"{i + 1}. {folder}" for i, folder in enumerate(sd_card_folders)])
@@ -194,8 +438,16 @@ def main():
         ["Folder containing selected .jpg files", selected_jpg_folder],
         ["SD card folders", sd_folders_summary],
         ["Output folder for .arw files", output_folder],
+        ["Metadata index file", index_path],
+        ["Copy mode", copy_mode],
+        ["Concurrent reads / writes", f"{read_workers} / {write_workers}"],
+        ["Maximum MB in flight", max_inflight_mb],
+        ["Concurrent operations per device", per_device_limit],
+        ["Automatic disambiguation", "yes" if auto_resolve else "no"],
+        ["Checksum verification", f"yes ({HASH_NAME})" if verify else "no"],
         ["Number of workers", num_workers],
-        ["Batch size", batch_size]
+        ["Scanning engine", f"{scan_engine} ({scan_concurrency} concurrent reads per card)" if scan_engine == "async" else scan_engine],
+        ["Automatic tuning", f"yes (settings in {DEFAULT_TUNING_PATH})" if autotune else "no"]
     ]
 
     print(tabulate(summary_table, tablefmt="grid"))
@@ -205,42 +457,10 @@ def main():
         print("Operation cancelled.")
         return
 
-    start_time = time.time()
-
-    # Create output folder if it does not exist
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    # Preload metadata for all .arw files using multiple threads
-    print("\nPreloading metadata for .arw files...")
-    arw_files = []
-    with ThreadPoolExecutor(max_workers=num_workers) as executor:
-        futures = [executor.submit(find_arw_files, folder) for folder in sd_card_folders]
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Preloading metadata", unit="folder"):
-            arw_files.extend(future.result())
-
-    # Get the list of selected .jpg files
-    selected_jpg_files = [f for f in os.listdir(selected_jpg_folder) if f.lower().endswith('.jpg')]
-
-    unmatched_files = []
-
-    # Create a log file for .arw files not found
-    log_file_path = os.path.join(output_folder, "log.txt")
-    with open(log_file_path, "w") as log_file:
-        log_file.write("Log of missing .arw files:\n\n")
-        print("\nCopying corresponding .arw files to the output folder...")
-
-        for i in range(0, len(arw_files), batch_size):
-            arw_batch = arw_files[i:i + batch_size]
-            process_arw_batch(arw_batch, selected_jpg_files, selected_jpg_folder, output_folder, log_file, unmatched_files)
-
-    total_elapsed_time = time.time() - start_time
-    completion_message = f"Automatic part completed in {total_elapsed_time:.2f} seconds. Check the log file for any issues. Eventual exceptions will now be processed"
-    print(completion_message)
-    logging.info(completion_message)
-
-    # Handle unmatched files after initial processing
-    handle_unmatched_files(unmatched_files, output_folder, log_file)
+    run_job(selected_jpg_folder, sd_card_folders, output_folder, num_workers=num_workers, scan_engine=scan_engine,
+            index_path=index_path, copy_mode=copy_mode, read_workers=read_workers, write_workers=write_workers,
+            max_inflight_mb=max_inflight_mb, per_device_limit=per_device_limit, auto_resolve=auto_resolve,
+            verify=verify, interactive=True, scan_concurrency=scan_concurrency, autotune=autotune)
 
 if __name__ == "__main__":
     main()
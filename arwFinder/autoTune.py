@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import logging
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor
+from tabulate import tabulate
+from scanEngine import DEFAULT_SCAN_CONCURRENCY, enumerate_arw_paths
+
+DEFAULT_TUNING_PATH = os.path.join(os.path.expanduser("~"), ".arwFinder_tuning.json")
+TUNING_VERSION = 1
+
+SCAN_CANDIDATES = (1, 2, 4, 8, 16, 32, 64, 128)  # Concurrent header reads tried on each device, in order
+SCAN_STEP_SECONDS = 0.25  # Each scan step parses files until this much time has passed...
+SCAN_STEP_FILES = 512     # ...or this many files were parsed
+SCAN_MIN_FILES = 16       # Steps with fewer files (the card ran out) are not compared
+COPY_CANDIDATES = (1, 2, 4, 8)  # Concurrent copies per source device tried while copying
+COPY_STEP_BYTES = 128 * 1024 * 1024
+COPY_STEP_FILES = 8
+MIN_GAIN = 1.1            # A higher concurrency is only kept when it is at least 10% faster
+MIN_SAMPLES = 2           # Settings are only chosen (and stored) when at least this many concurrencies were compared
+CPU_BOUND_RATIO = 0.7     # Process CPU time / wall time above this: EXIF parsing is limited by the GIL, not the disk
+
+
+# Function to find the mount point of a path; tuned settings are remembered per mount point
+def mount_point(path):
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+# Best settings per device, kept in a JSON file:
+# {"version": 1, "devices": {mount point: {"st_dev": ..., "scan": {...}, "copy": {output mount point: {...}}}}}
+class TuningStore:
+    def __init__(self, tuning_path=DEFAULT_TUNING_PATH):
+        self.tuning_path = tuning_path
+        self.devices = {}
+        try:
+            with open(tuning_path) as tuning_file:
+                data = json.load(tuning_file)
+            if data.get("version") == TUNING_VERSION:
+                self.devices = data["devices"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable tuning file {tuning_path}: {e}")
+
+    def get_scan(self, mount):
+        return self.devices.get(mount, {}).get("scan")
+
+    def get_copy(self, mount, output_mount):
+        return self.devices.get(mount, {}).get("copy", {}).get(output_mount)
+
+    def _device(self, mount):
+        device = self.devices.setdefault(mount, {})
+        try:
+            device["st_dev"] = os.stat(mount).st_dev
+        except OSError:
+            pass
+        return device
+
+    def set_scan(self, mount, settings):
+        self._device(mount)["scan"] = dict(settings, updated=time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+    def set_copy(self, mount, output_mount, settings):
+        self._device(mount).setdefault("copy", {})[output_mount] = dict(settings, updated=time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+    # The file is replaced atomically, so an interrupted save never leaves it half written
+    def save(self):
+        temporary_path = self.tuning_path + ".tmp"
+        with open(temporary_path, "w") as tuning_file:
+            json.dump({"version": TUNING_VERSION, "devices": self.devices}, tuning_file, indent=2)
+        os.replace(temporary_path, self.tuning_path)
+
+
+# Function to try increasing concurrencies in order while each one is at least MIN_GAIN times faster than the best so far.
+# measure(concurrency) returns a sample dict with a "rate", or None when there is nothing left to measure.
+def hill_climb(candidates, measure):
+    samples = []
+    best = None
+    for concurrency in candidates:
+        sample = measure(concurrency)
+        if sample is None:
+            break
+        samples.append(sample)
+        if best is not None and sample["rate"] < best["rate"] * MIN_GAIN:
+            break
+        if best is None or sample["rate"] > best["rate"]:
+            best = sample
+    return best, samples
+
+
+# Function to parse the next files of paths on `concurrency` threads for about SCAN_STEP_SECONDS, measuring
+# files/s and how much of the wall time the process spent on the CPU
+def measure_scan(paths, parse_date, concurrency):
+    files = 0
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while files < SCAN_STEP_FILES and time.perf_counter() - wall_start < SCAN_STEP_SECONDS:
+            batch = list(islice(paths, 4 * concurrency))
+            if not batch:
+                break
+            list(executor.map(parse_date, batch))
+            files += len(batch)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    if files < SCAN_MIN_FILES:
+        return None
+    return {"concurrency": concurrency, "files": files, "rate": files / max(wall, 1e-9), "cpu_ratio": cpu / max(wall, 1e-9)}
+
+
+# Function to turn the best scan sample of one device into settings: CPU-bound parsing goes to worker processes (or
+# stays on threads with a single core, where overlapping cannot help), I/O-bound parsing that gains from overlapping
+# reads goes to the async engine, the rest stays on threads
+def choose_scan_settings(best, cpu_count):
+    settings = {"files_per_s": round(best["rate"], 1), "cpu_ratio": round(best["cpu_ratio"], 2)}
+    if best["cpu_ratio"] >= CPU_BOUND_RATIO:
+        if cpu_count > 1:
+            settings.update(engine="process", num_workers=cpu_count)
+        else:
+            settings.update(engine="thread")
+    elif best["concurrency"] > 1:
+        settings.update(engine="async", scan_concurrency=best["concurrency"])
+    else:
+        settings.update(engine="thread")
+    return settings
+
+
+# Chooses the scanning engine and the concurrency of each stage from throughput sampled at the start of a run.
+# Settings found for a device are stored in the tuning file and reused on later runs, unless retune is set.
+# With probe_copies=False only stored copy settings are used (e.g. for the small batches of watch mode).
+class AutoTuner:
+    def __init__(self, tuning_path=DEFAULT_TUNING_PATH, retune=False, probe_copies=True):
+        self.store = TuningStore(tuning_path)
+        self.retune = retune
+        self.probe_copies = probe_copies
+        self.decisions = {}
+
+    # Function to return the scan settings for the SD folders: per mount point, stored ones or sampled ones.
+    # With several devices the engine of the slowest one is used, and the largest concurrency of any of them; the
+    # settings passed in are kept where no device could be tuned.
+    def tune_scan(self, sd_folders, parse_date, scan_engine, num_workers, per_device_limit, scan_concurrency=DEFAULT_SCAN_CONCURRENCY):
+        folders_by_mount = {}
+        for sd_folder in sd_folders:
+            folders_by_mount.setdefault(mount_point(sd_folder), []).append(sd_folder)
+        per_mount = {}
+        tuned_any = False
+        for mount, folders in folders_by_mount.items():
+            settings = None if self.retune else self.store.get_scan(mount)
+            if settings is not None:
+                print(f"Scan settings for {mount} from {self.store.tuning_path}: {describe(settings)}")
+                per_mount[mount] = settings
+                continue
+            print(f"Sampling scan throughput on {mount}...")
+            paths = chain.from_iterable(enumerate_arw_paths(folder) for folder in folders)
+            best, samples = hill_climb(SCAN_CANDIDATES, lambda concurrency: measure_scan(paths, parse_date, concurrency))
+            if len(samples) < MIN_SAMPLES:
+                logging.info(f"Too few .arw files on {mount} to tune the scan")
+                continue
+            settings = choose_scan_settings(best, os.cpu_count() or 1)
+            logging.info(f"Scan samples for {mount}: " + ", ".join(
+                f"{sample['concurrency']}: {sample['rate']:.0f} files/s (CPU {sample['cpu_ratio']:.2f})" for sample in samples))
+            print(f"Tuned scan for {mount}: {describe(settings)}")
+            self.store.set_scan(mount, settings)
+            per_mount[mount] = settings
+            tuned_any = True
+        if tuned_any:
+            self._save()
+
+        tuned = {"engine": scan_engine, "num_workers": num_workers, "per_device_limit": per_device_limit,
+                 "scan_concurrency": scan_concurrency}
+        if per_mount:
+            slowest = min(per_mount.values(), key=lambda settings: settings["files_per_s"])
+            tuned["engine"] = slowest["engine"]
+            tuned["num_workers"] = max([num_workers] + [settings.get("num_workers", 0) for settings in per_mount.values()])
+            tuned["per_device_limit"] = max([per_device_limit] + [settings.get("per_device_limit", 0) for settings in per_mount.values()])
+            if any("scan_concurrency" in settings for settings in per_mount.values()):
+                tuned["scan_concurrency"] = max(settings.get("scan_concurrency", 0) for settings in per_mount.values())
+        self.decisions["scan"] = dict(tuned, devices=per_mount)
+        return tuned
+
+    # Function to copy the first jobs with increasing concurrency until it stops paying off. The in-kernel copy modes
+    # copy on the writer threads, so readers and writers are both set to the concurrency per device times the number
+    # of source devices. run_batch(jobs, read_workers, write_workers, per_device_limit) copies a batch and returns its
+    # CopyResults. Returns the (read_workers, write_workers, per_device_limit) for the remaining jobs, the results so
+    # far and the remaining jobs.
+    def tune_copy(self, copy_jobs, output_folder, run_batch, read_workers, write_workers, per_device_limit):
+        output_mount = mount_point(output_folder)
+        source_mounts = sorted({mount_point(os.path.dirname(source_path)) for source_path, _ in copy_jobs})
+        stored = [self.store.get_copy(mount, output_mount) for mount in source_mounts]
+        if source_mounts and not self.retune and all(settings is not None for settings in stored):
+            tuned_limit = max(settings["per_device_limit"] for settings in stored)
+            workers = tuned_limit * len(source_mounts)
+            decision = {"per_device_limit": tuned_limit, "read_workers": workers, "write_workers": workers}
+            if self.decisions.get("copy") != decision:
+                print(f"Copy settings from {self.store.tuning_path}: {tuned_limit} concurrent copies per device")
+                self.decisions["copy"] = decision
+            return (workers, workers, tuned_limit), [], copy_jobs
+        if not self.probe_copies:
+            return (read_workers, write_workers, per_device_limit), [], copy_jobs
+
+        results = []
+        remaining = list(copy_jobs)
+
+        def measure(concurrency):
+            batch = []
+            batch_bytes = 0
+            while remaining and (batch_bytes < COPY_STEP_BYTES or len(batch) < COPY_STEP_FILES):
+                job = remaining.pop(0)
+                batch.append(job)
+                try:
+                    batch_bytes += os.path.getsize(job[0])
+                except OSError:
+                    pass
+            if not batch:
+                return None
+            start = time.perf_counter()
+            workers = concurrency * len(source_mounts)
+            batch_results = run_batch(batch, workers, workers, concurrency)
+            elapsed = time.perf_counter() - start
+            results.extend(batch_results)
+            copied_bytes = sum(result.size for result in batch_results if result.error is None and result.method != "skipped")
+            # A batch that was only partly copied (the rest already done by an earlier run) is not a fair sample
+            if len(batch) < COPY_STEP_FILES or copied_bytes < batch_bytes / 2:
+                return None
+            return {"concurrency": concurrency, "bytes": copied_bytes, "rate": copied_bytes / max(elapsed, 1e-9)}
+
+        best, samples = hill_climb(COPY_CANDIDATES, measure)
+        if len(samples) < MIN_SAMPLES:
+            logging.info("Too few files copied to tune the copy concurrency")
+            return (read_workers, write_workers, per_device_limit), results, remaining
+        logging.info("Copy samples: " + ", ".join(f"{sample['concurrency']}: {sample['rate'] / 1024 / 1024:.1f} MB/s" for sample in samples))
+        settings = {"per_device_limit": best["concurrency"], "mb_per_s": round(best["rate"] / 1024 / 1024, 1)}
+        print(f"Tuned copy: {best['concurrency']} concurrent copies per device ({settings['mb_per_s']} MB/s)")
+        for mount in source_mounts:
+            self.store.set_copy(mount, output_mount, settings)
+        self._save()
+        workers = best["concurrency"] * len(source_mounts)
+        self.decisions["copy"] = dict(settings, read_workers=workers, write_workers=workers)
+        return (workers, workers, best["concurrency"]), results, remaining
+
+    def _save(self):
+        try:
+            self.store.save()
+        except OSError as e:
+            logging.warning(f"Cannot save tuned settings to {self.store.tuning_path}: {e}")
+
+
+def describe(settings):
+    if settings["engine"] == "process":
+        return f"process engine, {settings['num_workers']} workers ({settings['files_per_s']} files/s)"
+    if settings["engine"] == "async":
+        return f"async engine, {settings['scan_concurrency']} concurrent reads ({settings['files_per_s']} files/s)"
+    return f"thread engine ({settings['files_per_s']} files/s)"
+
+
+if __name__ == "__main__":
+    store = TuningStore(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TUNING_PATH)
+    rows = []
+    for mount, device in sorted(store.devices.items()):
+        scan = device.get("scan")
+        rows.append([mount, describe(scan) if scan else "-", scan["updated"] if scan else "-"])
+        for output_mount, copy in sorted(device.get("copy", {}).items()):
+            rows.append([f"{mount} -> {output_mount}", f"{copy['per_device_limit']} concurrent copies per device ({copy['mb_per_s']} MB/s)", copy["updated"]])
+    print(tabulate(rows, headers=["Device", "Settings", "Updated"]))
@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import exifread
+from tabulate import tabulate
+from fastExif import read_exif_date, read_creation_date, ExifFormatError
+from scanEngine import SCAN_ENGINES
+from joinEngine import build_arw_index, plan_matches
+from copyBackend import COPY_MODES
+from copyScheduler import CopyScheduler
+from syntheticCard import DEFAULT_ARW_SIZE, load_or_generate_dataset
+import arwFinder_highPerformance
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), "arwFinder_benchmark")
+DEFAULT_RESULTS_FILE = "benchmark_results.jsonl"
+STAGES = ("exif", "scan", "match", "copy")
+
+
+# Function to collect sample files by extension from the given folders
+def collect_files(folders, extensions, limit):
+    samples = {ext: [] for ext in extensions}
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for file in sorted(files):
+                ext = os.path.splitext(file)[1].lower()
+                if ext in samples and len(samples[ext]) < limit:
+                    samples[ext].append(os.path.join(root, file))
+    return samples
+
+
+# Function to drop files from the page cache, so the next timed run reads them from the disk again.
+# Directory entries and inodes stay cached (dropping those needs root), so scans are only partly cold.
+def evict_from_page_cache(paths):
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+# Function to time func over repeat runs (calling before() untimed ahead of each run); returns (best seconds, last result)
+def time_best(func, repeat, before=None):
+    best = None
+    result = None
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def make_record(stage, variant, files, seconds, size_bytes=0, **extra):
+    return {"stage": stage, "variant": variant, "files": files, "seconds": round(seconds, 6),
+            "files_per_s": round(files / max(seconds, 1e-9), 1),
+            "mb_per_s": round(size_bytes / 1024 / 1024 / max(seconds, 1e-9), 1) if size_bytes else None, **extra}
+
+
+# Original code path: full exifread parse with default options
+def read_date_full_exifread(file_path):
+    with open(file_path, 'rb') as f:
+        tags = exifread.process_file(f)
+    return str(tags.get('EXIF DateTimeOriginal', ''))
+
+
+def read_date_fast(file_path):
+    try:
+        return read_exif_date(file_path).strftime('%Y:%m:%d %H:%M:%S')
+    except (ExifFormatError, ValueError):
+        return ''
+
+
+# Function to time one reader over a list of files, returning seconds per file and the results
+def time_reader(reader, files, repeat, cold=False):
+    best, results = time_best(lambda: [reader(path) for path in files], repeat,
+                              (lambda: evict_from_page_cache(files)) if cold else None)
+    return best / max(len(files), 1), results
+
+
+def benchmark_exif(folders, limit, repeat, cold=False):
+    samples = collect_files(folders, ['.arw', '.jpg'], limit)
+    rows = []
+    records = []
+    for ext, files in samples.items():
+        if not files:
+            continue
+        slow_per_file, slow_results = time_reader(read_date_full_exifread, files, repeat, cold)
+        fast_per_file, fast_results = time_reader(read_date_fast, files, repeat, cold)
+        mismatches = sum(1 for a, b in zip(slow_results, fast_results) if a != b)
+        rows.append([ext, len(files), f"{slow_per_file * 1000:.3f}", f"{fast_per_file * 1000:.3f}",
+                     f"{slow_per_file / max(fast_per_file, 1e-9):.1f}x", mismatches])
+        records.append(make_record("exif", f"exifread{ext}", len(files), slow_per_file * len(files)))
+        records.append(make_record("exif", f"fast{ext}", len(files), fast_per_file * len(files), mismatches=mismatches))
+    print(tabulate(rows, headers=["Type", "Files", "exifread ms/file", "fast ms/file", "Speedup", "Mismatches"]))
+    return records
+
+
+# Function to time every scanning engine as used by main() (device scheduling, no metadata index).
+# Returns the records and the .arw files found by the last engine, for the match stage.
+def benchmark_scan(folders, num_workers, repeat, cold=False):
+    rows = []
+    records = []
+    arw_files = []
+    arw_paths = collect_files(folders, ['.arw'], sys.maxsize)['.arw'] if cold else []
+    for engine in SCAN_ENGINES:
+        def before():
+            arwFinder_highPerformance.metadata_cache.clear()
+            if cold:
+                evict_from_page_cache(arw_paths)
+        best, arw_files = time_best(lambda: arwFinder_highPerformance.scan_arw_files(folders, num_workers, engine), repeat, before)
+        found = len(arw_files)
+        rows.append([engine, num_workers, found, f"{best:.3f}", f"{found / max(best, 1e-9):.0f}"])
+        records.append(make_record("scan", engine, found, best, workers=num_workers))
+    print(tabulate(rows, headers=["Engine", "Workers", "Files", "Seconds", "Files/s"]))
+    return records, arw_files
+
+
+# Function to time the capture-time join alone (.jpg dates are read once up front) and check it against the
+# expected matches of a synthetic dataset, when known
+def benchmark_match(arw_files, selection_folder, repeat, expected_matches=None):
+    jpg_files = [f for f in os.listdir(selection_folder) if f.lower().endswith('.jpg')]
+    jpg_dates = {os.path.join(selection_folder, f): read_creation_date(os.path.join(selection_folder, f)) for f in jpg_files}
+    get_base_name = arwFinder_highPerformance.get_base_name
+
+    def run():
+        return plan_matches(build_arw_index(arw_files), jpg_files, selection_folder, jpg_dates.get, get_base_name)
+    best, plan = time_best(run, repeat)
+    extra = {"unique": len(plan.unique), "ambiguous": len(plan.ambiguous), "missing": len(plan.missing)}
+    if expected_matches is not None:
+        extra["wrong"] = sum(1 for jpg_file, _, _, arw_path in plan.unique if expected_matches.get(jpg_file) != arw_path)
+    print(tabulate([[len(arw_files), len(jpg_files), f"{best:.3f}", f"{len(jpg_files) / max(best, 1e-9):.0f}",
+                     extra["unique"], extra["ambiguous"], extra["missing"], extra.get("wrong", "-")]],
+                   headers=["ARW files", "JPG files", "Seconds", "JPG/s", "Unique", "Ambiguous", "Missing", "Wrong"]))
+    return [make_record("match", "capture_time_index", len(jpg_files), best, arw_files=len(arw_files), **extra)]
+
+
+# Function to time the copy scheduler in each copy mode on the first limit .arw files, into a scratch folder
+def benchmark_copy(folders, work_dir, limit, repeat, copy_modes=COPY_MODES, cold=False):
+    arw_paths = collect_files(folders, ['.arw'], limit)['.arw']
+    output_folder = os.path.join(work_dir, "copy_output")
+    jobs = [(path, os.path.join(output_folder, f"{number:06d}_{os.path.basename(path)}")) for number, path in enumerate(arw_paths)]
+    total_bytes = sum(os.path.getsize(path) for path in arw_paths)
+    rows = []
+    records = []
+    for copy_mode in copy_modes:
+        def before():
+            shutil.rmtree(output_folder, ignore_errors=True)
+            os.makedirs(output_folder)
+            if cold:
+                evict_from_page_cache(arw_paths)
+        best, results = time_best(lambda: CopyScheduler(copy_mode).run(jobs, desc=f"Copying ({copy_mode})"), repeat, before)
+        failed = sum(1 for result in results if result.error is not None)
+        methods = sorted({result.method for result in results if result.method})
+        rows.append([copy_mode, ", ".join(methods), len(jobs), f"{total_bytes / 1024 / 1024:.1f}", f"{best:.3f}",
+                     f"{len(jobs) / max(best, 1e-9):.0f}", f"{total_bytes / 1024 / 1024 / max(best, 1e-9):.1f}", failed])
+        records.append(make_record("copy", copy_mode, len(jobs), best, total_bytes, methods=methods, failed=failed))
+    shutil.rmtree(output_folder, ignore_errors=True)
+    print(tabulate(rows, headers=["Mode", "Methods", "Files", "MB", "Seconds", "Files/s", "MB/s", "Failed"]))
+    return records
+
+
+# Function to describe the machine and code version, so recorded results can be compared over time
+def environment_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'), "commit": commit, "python": platform.python_version(),
+            "platform": platform.platform(), "machine": platform.node(), "cpu_count": os.cpu_count()}
+
+
+def record_key(dataset, record):
+    return (json.dumps(dataset, sort_keys=True), record["stage"], record["variant"], record.get("workers"))
+
+
+# Function to load the latest earlier result for every (dataset, stage, variant, workers) on this machine
+def load_previous_results(results_path, machine):
+    previous = {}
+    if not results_path or not os.path.exists(results_path):
+        return previous
+    with open(results_path) as results_file:
+        for line in results_file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry["environment"].get("machine") != machine:
+                continue
+            for record in entry["records"]:
+                previous[record_key(entry["dataset"], record)] = (entry["environment"], record)
+    return previous
+
+
+def append_results(results_path, environment, dataset, records):
+    with open(results_path, "a") as results_file:
+        results_file.write(json.dumps({"environment": environment, "dataset": dataset, "records": records}) + "\n")
+
+
+# Function to print every record next to the previous run on this machine with the same dataset
+def print_comparison(runs, previous):
+    rows = []
+    for dataset, records in runs:
+        label = f"synthetic {dataset['num_files']}" if "num_files" in dataset else "folders"
+        for record in records:
+            earlier = previous.get(record_key(dataset, record))
+            previous_rate = previous_commit = change = "-"
+            if earlier is not None:
+                previous_rate = earlier[1]["files_per_s"]
+                previous_commit = earlier[0].get("commit") or "-"
+                change = f"{(record['files_per_s'] / max(previous_rate, 1e-9) - 1) * 100:+.1f}%"
+            rows.append([label, record["stage"], record["variant"], record["files"], f"{record['seconds']:.3f}",
+                         record["files_per_s"], previous_rate, previous_commit, change])
+    print(tabulate(rows, headers=["Dataset", "Stage", "Variant", "Files", "Seconds", "Files/s", "Previous files/s",
+                                  "Previous commit", "Change"]))
+
+
+def run_stages(stages, folders, selection_folder, expected_matches, args):
+    records = []
+    if "exif" in stages:
+        records.extend(benchmark_exif(folders, args.limit, args.repeat, args.cold))
+    arw_files = None
+    if "scan" in stages:
+        scan_records, arw_files = benchmark_scan(folders, args.workers, args.repeat, args.cold)
+        records.extend(scan_records)
+    if "match" in stages and selection_folder is not None:
+        if arw_files is None:
+            arw_files = arwFinder_highPerformance.scan_arw_files(folders, args.workers)
+        records.extend(benchmark_match(arw_files, selection_folder, args.repeat, expected_matches))
+    if "copy" in stages:
+        records.extend(benchmark_copy(folders, args.work_dir, args.copy_limit, args.repeat, args.copy_modes, args.cold))
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark arwFinder stages on real card dumps or synthetic SD cards")
+    parser.add_argument("folders", nargs="*", help="Folders containing .arw and .jpg files")
+    parser.add_argument("--synthetic", type=int, nargs="*", metavar="FILES",
+                        help=f"Benchmark generated cards with this many shots (default sizes: {' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument("--selection", help="Folder of selected .jpg files for the match stage with real folders")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="Where synthetic datasets and copy outputs are kept")
+    parser.add_argument("--cards", type=int, default=2, help="Synthetic SD cards per dataset")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic datasets")
+    parser.add_argument("--arw-size", type=int, default=DEFAULT_ARW_SIZE, help="Size of each synthetic .arw file in bytes")
+    parser.add_argument("--dense", action="store_true", help="Write synthetic .arw files in full instead of sparse")
+    parser.add_argument("--limit", type=int, default=500, help="Maximum number of files per type for the EXIF stage")
+    parser.add_argument("--copy-limit", type=int, default=200, help="Number of .arw files copied per copy mode")
+    parser.add_argument("--copy-modes", nargs="+", choices=COPY_MODES, default=list(COPY_MODES), help="Copy modes to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per measurement (best time is kept)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Workers for the scanning engines")
+    parser.add_argument("--stage", choices=("all",) + STAGES, default="all", help="Stage to benchmark")
+    parser.add_argument("--cold", action="store_true", help="Evict the files from the page cache before every timed run")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_FILE, help="JSON Lines file the results are appended to ('none' to skip)")
+    args = parser.parse_args()
+    if not args.folders and args.synthetic is None:
+        parser.error("give folders to benchmark or --synthetic")
+    stages = STAGES if args.stage == "all" else (args.stage,)
+    results_path = None if args.results.lower() == "none" else args.results
+    environment = environment_info()
+    previous = load_previous_results(results_path, environment["machine"])
+
+    # Note: without --cold, repeated runs are served from the page cache, so this measures parsing cost rather than card bandwidth
+    runs = []
+    if args.folders:
+        print(f"\nBenchmarking {', '.join(args.folders)}")
+        dataset = {"folders": sorted(os.path.abspath(folder) for folder in args.folders)}
+        runs.append((dataset, run_stages(stages, args.folders, args.selection, None, args)))
+    for num_files in (args.synthetic or DEFAULT_SIZES) if args.synthetic is not None else []:
+        print(f"\nPreparing synthetic dataset with {num_files} shots...")
+        dataset_root = os.path.join(args.work_dir, f"synthetic_{num_files}_{args.cards}_{args.seed}")
+        os.makedirs(dataset_root, exist_ok=True)
+        dataset = load_or_generate_dataset(dataset_root, num_files, num_cards=args.cards, seed=args.seed,
+                                           arw_size=args.arw_size, dense=args.dense)
+        print(f"Benchmarking synthetic dataset with {num_files} shots")
+        runs.append((dataset["parameters"], run_stages(stages, dataset["card_folders"], dataset["selection_folder"],
+                                                        dataset["expected_matches"], args)))
+
+    print("\nSummary:")
+    print_comparison(runs, previous)
+    if results_path is not None:
+        for dataset, records in runs:
+            append_results(results_path, environment, dataset, records)
+        print(f"\nResults appended to {results_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
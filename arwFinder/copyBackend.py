@@ -0,0 +1,155 @@
+import os
+import sys
+import errno
+import shutil
+import logging
+import threading
+
+COPY_MODES = ("reflink", "hardlink", "copy", "buffered")
+CHUNK_SIZE = 8 * 1024 * 1024
+# Windows opens descriptors in text mode unless asked otherwise; elsewhere this flag does not exist
+O_BINARY = getattr(os, "O_BINARY", 0)
+FICLONE = 0x40049409  # Linux ioctl: share all extents of the source file (btrfs, XFS, bcachefs, ...)
+
+# Errors meaning "this method does not work between these filesystems", as opposed to a real I/O error
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.EPERM}
+
+# (method, source st_dev, destination st_dev) combinations that already failed once, so they are not retried per file
+_unsupported = set()
+_unsupported_lock = threading.Lock()
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def _is_unsupported(method, src_dev, dst_dev):
+    return (method, src_dev, dst_dev) in _unsupported
+
+
+def _mark_unsupported(method, src_dev, dst_dev, error):
+    with _unsupported_lock:
+        if (method, src_dev, dst_dev) not in _unsupported:
+            logging.info(f"Copy method {method} unavailable between devices {src_dev} and {dst_dev}: {error}")
+            _unsupported.add((method, src_dev, dst_dev))
+
+
+# Function to fail a copy that ended early (source shrunk or short read), so a truncated file is never reported as copied
+def _check_complete(copied, size):
+    if copied < size:
+        raise OSError(errno.EIO, f"Copy ended after {copied} of {size} bytes")
+
+
+def _reflink(src_fd, dst_fd, size):
+    if fcntl is None or not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "reflink is only available on Linux")
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_file_range(src_fd, dst_fd, size):
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "os.copy_file_range is not available")
+    offset = 0
+    while offset < size:
+        copied = os.copy_file_range(src_fd, dst_fd, min(CHUNK_SIZE, size - offset), offset, offset)
+        if copied == 0:
+            break
+        offset += copied
+    _check_complete(offset, size)
+
+
+def _sendfile(src_fd, dst_fd, size):
+    if not hasattr(os, "sendfile") or not sys.platform.startswith("linux"):
+        raise OSError(errno.ENOSYS, "file to file sendfile is not available")
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, min(CHUNK_SIZE, size - offset))
+        if sent == 0:
+            break
+        offset += sent
+    _check_complete(offset, size)
+
+
+def _chunked(src_fd, dst_fd, size):
+    copied = 0
+    while True:
+        data = os.read(src_fd, CHUNK_SIZE)
+        if not data:
+            break
+        copied += len(data)
+        view = memoryview(data)
+        while view:
+            written = os.write(dst_fd, view)
+            view = view[written:]
+    _check_complete(copied, size)
+
+
+METHODS = {
+    "reflink": _reflink,
+    "copy_file_range": _copy_file_range,
+    "sendfile": _sendfile,
+    "chunked": _chunked,
+}
+
+# Methods tried in order for each copy mode; "chunked" always works and ends every chain
+METHOD_CHAINS = {
+    "reflink": ("reflink", "copy_file_range", "sendfile", "chunked"),
+    "hardlink": ("reflink", "copy_file_range", "sendfile", "chunked"),
+    "copy": ("copy_file_range", "sendfile", "chunked"),
+    "buffered": ("chunked",),
+}
+
+
+# Function to replace output_path with a hard link to source_path (same filesystem only)
+def _hardlink(source_path, output_path):
+    temp_path = output_path + ".link-tmp"
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    os.link(source_path, temp_path)
+    os.replace(temp_path, output_path)
+
+
+# Function to copy a file with the fastest available method; returns the name of the method that was used
+def copy_file(source_path, output_path, mode="reflink"):
+    if mode not in METHOD_CHAINS:
+        raise ValueError(f"Unknown copy mode '{mode}'. Choose one of: {', '.join(COPY_MODES)}")
+    src_stat = os.stat(source_path)
+    dst_dev = os.stat(os.path.dirname(os.path.abspath(output_path))).st_dev
+
+    if mode == "hardlink" and not _is_unsupported("hardlink", src_stat.st_dev, dst_dev):
+        try:
+            _hardlink(source_path, output_path)
+            return "hardlink"
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS and e.errno != errno.EMLINK:
+                raise
+            _mark_unsupported("hardlink", src_stat.st_dev, dst_dev, e)
+
+    src_fd = os.open(source_path, os.O_RDONLY | O_BINARY)
+    try:
+        dst_fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o644)
+        try:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            for method in METHOD_CHAINS[mode]:
+                if method != "chunked" and _is_unsupported(method, src_stat.st_dev, dst_dev):
+                    continue
+                try:
+                    METHODS[method](src_fd, dst_fd, src_stat.st_size)
+                except OSError as e:
+                    if method == "chunked" or e.errno not in UNSUPPORTED_ERRNOS:
+                        raise
+                    _mark_unsupported(method, src_stat.st_dev, dst_dev, e)
+                    # Discard any partial output before trying the next method
+                    os.ftruncate(dst_fd, 0)
+                    os.lseek(dst_fd, 0, os.SEEK_SET)
+                    os.lseek(src_fd, 0, os.SEEK_SET)
+                    continue
+                break
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(source_path, output_path)
+    return method
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+JOURNAL_FILE_NAME = ".arwFinder_journal.jsonl"
+PARTIAL_SUFFIX = ".part"
+PARTIAL_MIN_AGE = 60  # Seconds without changes before a partial file is considered abandoned
+
+
+# Function to check whether a destination already holds the same file (copies keep size and mtime via copystat)
+def is_identical(source_stat, output_path):
+    try:
+        output_stat = os.stat(output_path)
+    except OSError:
+        return False
+    return output_stat.st_size == source_stat.st_size and output_stat.st_mtime_ns == source_stat.st_mtime_ns
+
+
+# Function to remove partial files left behind by an interrupted run. They are deleted rather than resumed, as the
+# copy is redone from the start. Only "<name>.arw.part" files written by this tool are touched, and only when they
+# have not changed for PARTIAL_MIN_AGE seconds, so a copy in progress in another session on the same folder is kept.
+def cleanup_partial_files(output_folder):
+    removed = 0
+    now = time.time()
+    for file in os.listdir(output_folder):
+        if not file.lower().endswith('.arw' + PARTIAL_SUFFIX):
+            continue
+        partial_path = os.path.join(output_folder, file)
+        try:
+            if now - os.stat(partial_path).st_mtime < PARTIAL_MIN_AGE:
+                continue
+            os.remove(partial_path)
+        except OSError:
+            continue
+        logging.warning(f"Removed partial file {file} from an interrupted run")
+        removed += 1
+    return removed
+
+
+# Function to build "<stem> (n)<ext>", the name file managers give to clashing copies
+def numbered_name(name, number):
+    stem, extension = os.path.splitext(name)
+    return f"{stem} ({number}){extension}"
+
+
+# Function to pick an output path per source. Different .arw files can share a name (the _DSC counter repeats across
+# cards and after wrapping), so a name already taken by another source gets a " (2)", " (3)", ... suffix instead of
+# being overwritten. With a journal the choice is remembered, so reruns and watch mode keep the same names.
+def assign_output_paths(source_paths, output_folder, journal=None):
+    if journal is not None:
+        return [journal.assign_destination(source_path, output_folder) for source_path in source_paths]
+    owners = {}
+    output_paths = []
+    for source_path in source_paths:
+        name = os.path.basename(source_path)
+        output_path = os.path.join(output_folder, name)
+        number = 2
+        while owners.get(output_path, source_path) != source_path:
+            output_path = os.path.join(output_folder, numbered_name(name, number))
+            number += 1
+        owners[output_path] = source_path
+        output_paths.append(output_path)
+    return output_paths
+
+
+# Append-only journal of completed copies in the output folder, used to resume interrupted runs
+class CopyJournal:
+    def __init__(self, output_folder):
+        self.journal_path = os.path.join(output_folder, JOURNAL_FILE_NAME)
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as journal_file:
+                for line_number, line in enumerate(journal_file, 1):
+                    try:
+                        entry = json.loads(line)
+                        if not isinstance(entry, dict) or not (entry.get("removed") or "source" in entry):
+                            raise ValueError("not a journal entry")
+                        if entry.get("removed"):
+                            self.entries.pop(entry["destination"], None)
+                        else:
+                            self.entries[entry["destination"]] = entry
+                    except (ValueError, KeyError):
+                        # A line cut short by an interruption (or otherwise unreadable) is ignored; that copy is simply redone
+                        logging.warning(f"Ignoring unreadable line {line_number} in {self.journal_path}")
+        self.sources = {entry["source"]: output_path for output_path, entry in self.entries.items()}
+        self.assigned = {}  # output path -> source path, for destinations handed out but not copied yet
+        self.journal_file = open(self.journal_path, "a")
+
+    # Function to decide whether a copy can be skipped: journaled from the same source, or already identical.
+    # With require_verified, only copies whose checksum was verified by an earlier run are skipped.
+    def is_done(self, source_path, output_path, source_stat, require_verified=False):
+        entry = self.entries.get(output_path)
+        if require_verified and (entry is None or not entry.get("verified")):
+            return False
+        if entry is not None and (entry["source"], entry["size"], entry["mtime_ns"]) != \
+                (source_path, source_stat.st_size, source_stat.st_mtime_ns):
+            return False
+        return is_identical(source_stat, output_path)
+
+    def get(self, output_path):
+        return self.entries.get(output_path)
+
+    # Function to return the output path used for a source, or None if it was never assigned one
+    def destination_of(self, source_path):
+        with self.lock:
+            return self.sources.get(source_path)
+
+    def _is_taken(self, output_path, source_path, source_stat):
+        owner = self.assigned.get(output_path)
+        if owner is None and output_path in self.entries:
+            owner = self.entries[output_path]["source"]
+        if owner is not None:
+            return owner != source_path
+        # A file the journal does not know about is only reused when it is already identical to the source
+        return os.path.lexists(output_path) and (source_stat is None or not is_identical(source_stat, output_path))
+
+    # Function to return the output path of a source: the one it had before, or its own name unless another source
+    # already uses it, in which case the first free numbered name
+    def assign_destination(self, source_path, output_folder):
+        with self.lock:
+            output_path = self.sources.get(source_path)
+            if output_path is not None:
+                return output_path
+            try:
+                source_stat = os.stat(source_path)
+            except OSError:
+                source_stat = None
+            name = os.path.basename(source_path)
+            output_path = os.path.join(output_folder, name)
+            number = 2
+            while self._is_taken(output_path, source_path, source_stat):
+                output_path = os.path.join(output_folder, numbered_name(name, number))
+                number += 1
+            if number > 2:
+                logging.warning(f"{name} is already used by another .arw file in {output_folder}; "
+                                f"copying {source_path} as {os.path.basename(output_path)}")
+            self.assigned[output_path] = source_path
+            self.sources[source_path] = output_path
+            return output_path
+
+    def record(self, source_path, output_path, source_stat, file_hash=None, **extra):
+        entry = {
+            "source": source_path,
+            "destination": output_path,
+            "size": source_stat.st_size,
+            "mtime_ns": source_stat.st_mtime_ns,
+            "hash": file_hash,
+            "time": datetime.now().isoformat(timespec="seconds"),
+        }
+        entry.update(extra)
+        with self.lock:
+            self.entries[output_path] = entry
+            self.sources[source_path] = output_path
+            self.journal_file.write(json.dumps(entry) + "\n")
+            self.journal_file.flush()
+
+    # Function to record that a destination was removed again, so it is no longer treated as complete
+    def forget(self, output_path):
+        tombstone = {"destination": output_path, "removed": True, "time": datetime.now().isoformat(timespec="seconds")}
+        with self.lock:
+            entry = self.entries.pop(output_path, None)
+            source_path = self.assigned.pop(output_path, None) or (entry or {}).get("source")
+            if source_path is not None and self.sources.get(source_path) == output_path:
+                del self.sources[source_path]
+            self.journal_file.write(json.dumps(tombstone) + "\n")
+            self.journal_file.flush()
+
+    def close(self):
+        with self.lock:
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+            self.journal_file.close()
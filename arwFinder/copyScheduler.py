@@ -0,0 +1,253 @@
+import os
+import time
+import queue
+import shutil
+import logging
+import threading
+from tqdm import tqdm
+from copyBackend import CHUNK_SIZE, O_BINARY, copy_file
+from deviceScheduler import DEFAULT_PER_DEVICE_LIMIT, DeviceQueue
+from copyJournal import PARTIAL_SUFFIX
+from integrity import VerificationError, read_chunks_hashed, verify_file
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_INFLIGHT_MB = 1024
+DEFAULT_READ_WORKERS = 4
+DEFAULT_WRITE_WORKERS = 2
+DEFAULT_VERIFY_WORKERS = 2
+
+
+# Counting limit on bytes in flight between the read and write stages
+class ByteBudget:
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    # A file larger than the whole budget is admitted alone
+    def acquire(self, size):
+        size = min(size, self.capacity)
+        with self.condition:
+            while self.in_flight > 0 and self.in_flight + size > self.capacity:
+                self.condition.wait()
+            self.in_flight += size
+        return size
+
+    def release(self, size):
+        with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+
+# Result of one copy job; method is None when the copy failed and "skipped" when the destination was already complete
+class CopyResult:
+    def __init__(self, source_path, output_path, size, method=None, error=None):
+        self.source_path = source_path
+        self.output_path = output_path
+        self.size = size
+        self.method = method
+        self.error = error
+        self.file_hash = None
+        self.verified = False
+        self.seconds = None  # Time from the start of the read to the end of the write
+
+
+# Function to stat every job up front so the budget, progress bar and device scheduling use real sizes and devices
+def stat_jobs(jobs):
+    sized_jobs = []
+    failed = []
+    for source_path, output_path in jobs:
+        try:
+            sized_jobs.append((source_path, output_path, os.stat(source_path)))
+        except OSError as e:
+            failed.append(CopyResult(source_path, output_path, 0, error=e))
+    return sized_jobs, failed
+
+
+def read_chunks(source_path):
+    chunks = []
+    with open(source_path, 'rb') as source_file:
+        while True:
+            data = source_file.read(CHUNK_SIZE)
+            if not data:
+                break
+            chunks.append(data)
+    return chunks
+
+
+def write_chunks(output_path, chunks, source_path):
+    with open(output_path, 'wb') as dest_file:
+        for data in chunks:
+            dest_file.write(data)
+    shutil.copystat(source_path, output_path)
+
+
+# Ask the kernel to start reading the source from the card while earlier files are still being written
+def prefetch(source_path, size):
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(source_path, os.O_RDONLY | O_BINARY)
+    try:
+        os.posix_fadvise(fd, 0, size, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+# Producer/consumer copy pipeline: readers admit jobs under the byte budget, writers put them on the output disk.
+# Jobs are handed to readers round-robin across source devices, with at most per_device_limit reads per device.
+# With verify, data always goes through the read buffers, which are hashed as they are read; each destination is
+# then re-read from disk by a separate pool of verify_workers and checked against that hash.
+class CopyScheduler:
+    def __init__(self, copy_mode="reflink", max_inflight_bytes=DEFAULT_MAX_INFLIGHT_MB * 1024 * 1024,
+                 read_workers=DEFAULT_READ_WORKERS, write_workers=DEFAULT_WRITE_WORKERS, on_done=None,
+                 per_device_limit=DEFAULT_PER_DEVICE_LIMIT, journal=None, verify=False, manifest=None,
+                 verify_workers=DEFAULT_VERIFY_WORKERS):
+        self.copy_mode = copy_mode
+        self.journal = journal
+        self.verify = verify
+        self.manifest = manifest
+        self.verify_workers = max(1, verify_workers)
+        self.budget = ByteBudget(max_inflight_bytes)
+        self.per_device_limit = per_device_limit
+        self.read_workers = max(1, read_workers)
+        self.write_workers = max(1, write_workers)
+        self.on_done = on_done
+        self.results = []
+        self.results_lock = threading.Lock()
+
+    def _finish(self, result, progress):
+        with self.results_lock:
+            self.results.append(result)
+            progress.update(result.size)
+            elapsed = time.perf_counter() - self.start_time
+            progress.set_postfix(files=len(self.results), files_per_s=f"{len(self.results) / max(elapsed, 1e-9):.1f}")
+        if self.on_done is not None:
+            self.on_done(result)
+
+    def _reader(self, device_queue, write_queue, progress):
+        while True:
+            taken = device_queue.get()
+            if taken is None:
+                return
+            device, (source_path, output_path, source_stat) = taken
+            size = source_stat.st_size
+            admitted = self.budget.acquire(size)
+            started = time.perf_counter()
+            try:
+                # Buffered mode reads the data here; the in-kernel modes only prefetch and copy in the write stage,
+                # which then holds the source device slot until the copy is done
+                file_hash = None
+                if self.verify:
+                    chunks, file_hash = read_chunks_hashed(source_path)
+                elif self.copy_mode == "buffered":
+                    chunks = read_chunks(source_path)
+                else:
+                    chunks = None
+                if chunks is None:
+                    prefetch(source_path, size)
+                else:
+                    device_queue.release(device)
+                    device = None
+            except OSError as e:
+                device_queue.release(device)
+                self.budget.release(admitted)
+                self._finish(CopyResult(source_path, output_path, size, error=e), progress)
+                continue
+            write_queue.put((source_path, output_path, source_stat, admitted, chunks, file_hash, device, started))
+
+    # Function to verify a copy while it is still a partial file; only a copy that matches gets its final name
+    def _verify(self, result, source_stat, progress):
+        partial_path = result.output_path + PARTIAL_SUFFIX
+        try:
+            if not verify_file(partial_path, result.file_hash):
+                raise VerificationError(f"Checksum mismatch after copying to {result.output_path}")
+            os.replace(partial_path, result.output_path)
+            result.verified = True
+            if self.manifest is not None:
+                self.manifest.add(result.output_path, result.file_hash)
+            if self.journal is not None:
+                self.journal.record(result.source_path, result.output_path, source_stat, result.file_hash,
+                                    method=result.method, verified=True)
+        except Exception as e:
+            result.error = e
+            if os.path.lexists(partial_path):
+                os.remove(partial_path)
+        self._finish(result, progress)
+
+    def _writer(self, device_queue, write_queue, verify_executor, progress):
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            source_path, output_path, source_stat, admitted, chunks, file_hash, device, started = item
+            result = CopyResult(source_path, output_path, source_stat.st_size)
+            result.file_hash = file_hash
+            # Data goes to a partial file first, so an interrupted copy never looks complete
+            partial_path = output_path + PARTIAL_SUFFIX
+            try:
+                if chunks is not None:
+                    write_chunks(partial_path, chunks, source_path)
+                    result.method = "buffered"
+                else:
+                    result.method = copy_file(source_path, partial_path, self.copy_mode)
+                # With verify, the partial file is renamed only after its checksum matched
+                if not self.verify:
+                    os.replace(partial_path, output_path)
+                result.seconds = time.perf_counter() - started
+                if self.journal is not None and not self.verify:
+                    self.journal.record(source_path, output_path, source_stat, method=result.method)
+            except Exception as e:
+                result.error = e
+                if os.path.lexists(partial_path):
+                    os.remove(partial_path)
+            finally:
+                chunks = None
+                if device is not None:
+                    device_queue.release(device)
+                self.budget.release(admitted)
+            if self.verify and result.error is None:
+                # Verification is deferred to its own pool, so writers move on to the next file immediately
+                verify_executor.submit(self._verify, result, source_stat, progress)
+            else:
+                self._finish(result, progress)
+
+    # Function to run all (source_path, output_path) jobs and return a CopyResult per job
+    def run(self, jobs, desc="Copying .arw files"):
+        sized_jobs, failed = stat_jobs(jobs)
+        self.results = []
+        skipped = []
+        device_queue = DeviceQueue(self.per_device_limit)
+        total_bytes = 0
+        for job in sized_jobs:
+            if self.journal is not None and self.journal.is_done(*job, require_verified=self.verify):
+                skipped.append(CopyResult(job[0], job[1], 0, method="skipped"))
+                continue
+            device_queue.put(job[2].st_dev, job)
+            total_bytes += job[2].st_size
+        device_queue.close()
+        write_queue = queue.Queue()
+
+        self.start_time = time.perf_counter()
+        verify_executor = ThreadPoolExecutor(max_workers=self.verify_workers) if self.verify else None
+        with tqdm(total=total_bytes, desc=desc, unit="B", unit_scale=True, unit_divisor=1024) as progress:
+            for result in failed + skipped:
+                self._finish(result, progress)
+            readers = [threading.Thread(target=self._reader, args=(device_queue, write_queue, progress), daemon=True)
+                       for _ in range(min(self.read_workers, max(1, len(device_queue))))]
+            writers = [threading.Thread(target=self._writer, args=(device_queue, write_queue, verify_executor, progress), daemon=True)
+                       for _ in range(self.write_workers)]
+            for thread in readers + writers:
+                thread.start()
+            for thread in readers:
+                thread.join()
+            for _ in writers:
+                write_queue.put(None)
+            for thread in writers:
+                thread.join()
+            if verify_executor is not None:
+                verify_executor.shutdown(wait=True)
+
+        elapsed = time.perf_counter() - self.start_time
+        copied = [result for result in self.results if result.error is None and result.method != "skipped"]
+        logging.info(f"Copied {len(copied)} files ({sum(r.size for r in copied) / 1024 / 1024:.1f} MB) in {elapsed:.2f} seconds")
+        return self.results
@@ -0,0 +1,103 @@
+import os
+import logging
+import threading
+from collections import OrderedDict, deque
+
+DEFAULT_PER_DEVICE_LIMIT = 2
+
+
+# Function to get the device id (st_dev) of a path; files on the same card reader share it
+def device_of(path):
+    try:
+        return os.stat(path).st_dev
+    except OSError as e:
+        logging.warning(f"Cannot stat {path} to find its device: {e}")
+        return -1
+
+
+# Work queue that hands out items round-robin across devices, with at most per_device_limit items in progress per device
+class DeviceQueue:
+    def __init__(self, per_device_limit=DEFAULT_PER_DEVICE_LIMIT):
+        self.per_device_limit = max(1, per_device_limit)
+        self.pending = OrderedDict()  # device -> deque of items
+        self.active = {}              # device -> items in progress
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, device, item):
+        with self.condition:
+            if device not in self.pending:
+                self.pending[device] = deque()
+            self.pending[device].append(item)
+            self.condition.notify()
+
+    # No more items will be added; blocked consumers return None once everything is handed out
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def _take(self):
+        for device in list(self.pending):
+            if self.active.get(device, 0) < self.per_device_limit:
+                items = self.pending.pop(device)
+                item = items.popleft()
+                if items:
+                    self.pending[device] = items  # Re-inserted at the end: the next call starts with another device
+                self.active[device] = self.active.get(device, 0) + 1
+                return device, item
+        return None
+
+    # Function to get (device, item); with block=False it returns None when no device has a free slot right now
+    def get(self, block=True):
+        with self.condition:
+            while True:
+                taken = self._take()
+                if taken is not None or not block:
+                    return taken
+                if self.closed and not self.pending:
+                    return None
+                self.condition.wait()
+
+    def release(self, device):
+        with self.condition:
+            self.active[device] -= 1
+            self.condition.notify_all()
+
+    def __len__(self):
+        with self.condition:
+            return sum(len(items) for items in self.pending.values())
+
+
+# Function to run func(item) for all items on num_workers threads, interleaved and limited per device
+def run_per_device(items, device_key, func, num_workers, per_device_limit=DEFAULT_PER_DEVICE_LIMIT, on_result=None):
+    device_queue = DeviceQueue(per_device_limit)
+    for item in items:
+        device_queue.put(device_key(item), item)
+    device_queue.close()
+    errors = []
+    result_lock = threading.Lock()
+
+    def worker():
+        while True:
+            taken = device_queue.get()
+            if taken is None:
+                return
+            device, item = taken
+            try:
+                result = func(item)
+                if on_result is not None:
+                    with result_lock:
+                        on_result(item, result)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                device_queue.release(device)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, num_workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
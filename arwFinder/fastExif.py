@@ -0,0 +1,169 @@
+import os
+import struct
+import logging
+from datetime import datetime
+import exifread
+
+# Size of the first read; it covers the TIFF header and EXIF IFD of ARW and JPG files in nearly all cases
+HEADER_WINDOW = 64 * 1024
+# Upper bound on how far into a JPG we look for the APP1 (EXIF) segment
+JPG_SEGMENT_LIMIT = 256 * 1024
+
+TAG_EXIF_IFD_POINTER = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_SUBSEC_TIME_ORIGINAL = 0x9291
+TYPE_ASCII = 2
+MAX_IFD_ENTRIES = 1024
+
+
+class ExifFormatError(Exception):
+    pass
+
+
+# Small reader that serves bounded reads from the initial header window and seeks only when needed
+class WindowReader:
+    def __init__(self, file_obj, base_offset=0):
+        self.file_obj = file_obj
+        self.base_offset = base_offset
+        self.file_obj.seek(base_offset)
+        self.window = self.file_obj.read(HEADER_WINDOW)
+
+    def read_at(self, offset, size):
+        end = offset + size
+        if offset >= 0 and end <= len(self.window):
+            return self.window[offset:end]
+        self.file_obj.seek(self.base_offset + offset)
+        data = self.file_obj.read(size)
+        if len(data) != size:
+            raise ExifFormatError(f"Truncated read at offset {offset}")
+        return data
+
+
+# Function to locate the start of the TIFF structure inside a JPG (APP1 "Exif" segment)
+def _find_jpg_tiff_offset(file_obj):
+    file_obj.seek(0)
+    if file_obj.read(2) != b'\xff\xd8':
+        raise ExifFormatError("Not a JPG file")
+    position = 2
+    while position < JPG_SEGMENT_LIMIT:
+        file_obj.seek(position)
+        marker = file_obj.read(4)
+        if len(marker) != 4 or marker[0] != 0xFF:
+            break
+        marker_type = marker[1]
+        if marker_type == 0xD8 or 0xD0 <= marker_type <= 0xD7 or marker_type == 0x01:
+            position += 2
+            continue
+        if marker_type in (0xDA, 0xD9):  # Start of scan or end of image: no EXIF before pixel data
+            break
+        segment_length = struct.unpack('>H', marker[2:4])[0]
+        if marker_type == 0xE1 and file_obj.read(6) == b'Exif\x00\x00':
+            return position + 10
+        position += 2 + segment_length
+    raise ExifFormatError("No EXIF segment found")
+
+
+# Function to read one IFD as a dict {tag: (type, count, raw_value_bytes)}
+def read_ifd(reader, offset, byte_order):
+    entry_count = struct.unpack(byte_order + 'H', reader.read_at(offset, 2))[0]
+    if entry_count > MAX_IFD_ENTRIES:
+        raise ExifFormatError(f"Implausible IFD entry count {entry_count}")
+    entries_data = reader.read_at(offset + 2, entry_count * 12)
+    entries = {}
+    for i in range(entry_count):
+        tag, value_type, count = struct.unpack(byte_order + 'HHI', entries_data[i * 12:i * 12 + 8])
+        entries[tag] = (value_type, count, entries_data[i * 12 + 8:i * 12 + 12])
+    return entries
+
+
+# Function to validate the TIFF header and return (byte_order, IFD0 offset)
+def read_tiff_header(reader):
+    header = reader.read_at(0, 8)
+    byte_order = '<' if header[:2] == b'II' else '>'
+    if header[:2] not in (b'II', b'MM') or struct.unpack(byte_order + 'H', header[2:4])[0] != 42:
+        raise ExifFormatError("Invalid TIFF header")
+    return byte_order, struct.unpack(byte_order + 'I', header[4:8])[0]
+
+
+def _read_ascii(reader, entry, byte_order):
+    value_type, count, raw_value = entry
+    if value_type != TYPE_ASCII:
+        raise ExifFormatError(f"Unexpected tag type {value_type}")
+    if count <= 4:
+        data = raw_value[:count]
+    else:
+        value_offset = struct.unpack(byte_order + 'I', raw_value)[0]
+        data = reader.read_at(value_offset, count)
+    return data.split(b'\x00', 1)[0].decode('ascii', errors='replace').strip()
+
+
+# Function to turn DateTimeOriginal (+ optional SubSecTimeOriginal) strings into a datetime
+def combine_date_subsec(date_string, subsec_string=None):
+    creation_date = datetime.strptime(date_string, '%Y:%m:%d %H:%M:%S')
+    if subsec_string:
+        digits = ''.join(c for c in subsec_string if c.isdigit())[:6]
+        if digits:
+            creation_date = creation_date.replace(microsecond=int(digits.ljust(6, '0')))
+    return creation_date
+
+
+# Fast path: walk only the TIFF/EXIF IFD chain with bounded reads and stop at DateTimeOriginal + SubSecTimeOriginal
+def read_exif_date(file_path):
+    with open(file_path, 'rb') as f:
+        signature = f.read(4)
+        if signature[:2] == b'\xff\xd8':
+            tiff_offset = _find_jpg_tiff_offset(f)
+        elif signature in (b'II*\x00', b'MM\x00*'):
+            tiff_offset = 0
+        else:
+            raise ExifFormatError("Unsupported file signature")
+
+        reader = WindowReader(f, tiff_offset)
+        byte_order, ifd0_offset = read_tiff_header(reader)
+
+        ifd0 = read_ifd(reader, ifd0_offset, byte_order)
+        if TAG_EXIF_IFD_POINTER not in ifd0:
+            raise ExifFormatError("No EXIF IFD pointer in IFD0")
+        exif_offset = struct.unpack(byte_order + 'I', ifd0[TAG_EXIF_IFD_POINTER][2])[0]
+
+        exif_ifd = read_ifd(reader, exif_offset, byte_order)
+        if TAG_DATETIME_ORIGINAL not in exif_ifd:
+            raise ExifFormatError("No DateTimeOriginal tag")
+        date_string = _read_ascii(reader, exif_ifd[TAG_DATETIME_ORIGINAL], byte_order)
+        subsec_string = None
+        if TAG_SUBSEC_TIME_ORIGINAL in exif_ifd:
+            subsec_string = _read_ascii(reader, exif_ifd[TAG_SUBSEC_TIME_ORIGINAL], byte_order)
+    return combine_date_subsec(date_string, subsec_string)
+
+
+# Slow path: full exifread parse, skipping MakerNote and thumbnail decoding
+def read_exif_date_exifread(file_path):
+    with open(file_path, 'rb') as f:
+        tags = exifread.process_file(f, details=False, stop_tag='SubSecTimeOriginal')
+    date_tag = 'EXIF DateTimeOriginal'
+    if date_tag not in tags:
+        return None
+    subsec_tag = tags.get('EXIF SubSecTimeOriginal')
+    return combine_date_subsec(str(tags[date_tag]).strip(), str(subsec_tag) if subsec_tag else None)
+
+
+# Function to read the creation date, trying the fast path first and falling back to exifread
+def read_creation_date(file_path):
+    try:
+        return read_exif_date(file_path)
+    except (ExifFormatError, ValueError, struct.error, IndexError) as e:
+        logging.debug(f"Fast EXIF path failed for {file_path} ({e}), falling back to exifread")
+    except OSError as e:
+        logging.error(f"Error reading metadata from {file_path}: {e}")
+        return None
+    try:
+        return read_exif_date_exifread(file_path)
+    except Exception as e:
+        logging.error(f"Error reading metadata from {file_path}: {e}")
+    return None
+
+
+if __name__ == "__main__":
+    import sys
+    for path in sys.argv[1:]:
+        print(f"{os.path.basename(path)}: {read_creation_date(path)}")
@@ -0,0 +1,125 @@
+import os
+import shutil
+import hashlib
+import threading
+from copyBackend import CHUNK_SIZE, O_BINARY
+
+# xxhash is optional; BLAKE2b from the standard library is used when it is not installed
+try:
+    import xxhash
+    HASH_NAME = "xxh128"
+except ImportError:
+    xxhash = None
+    HASH_NAME = "blake2b"
+
+MANIFEST_FILE_NAME = f"manifest.{HASH_NAME}"
+
+
+def new_hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b()
+
+
+# Function to read a file in chunks, hashing the same buffers that will be written to the destination
+def read_chunks_hashed(source_path):
+    hasher = new_hasher()
+    chunks = []
+    with open(source_path, 'rb') as source_file:
+        while True:
+            data = source_file.read(CHUNK_SIZE)
+            if not data:
+                break
+            hasher.update(data)
+            chunks.append(data)
+    return chunks, hasher.hexdigest()
+
+
+# Function to copy a file through a hashing buffer; the source is read only once
+def copy_with_hash(source_path, output_path):
+    hasher = new_hasher()
+    with open(source_path, 'rb') as source_file, open(output_path, 'wb') as dest_file:
+        while True:
+            data = source_file.read(CHUNK_SIZE)
+            if not data:
+                break
+            hasher.update(data)
+            dest_file.write(data)
+    shutil.copystat(source_path, output_path)
+    return hasher.hexdigest()
+
+
+# Function to flush a written file to disk and drop it from the page cache, so verification reads the disk
+def flush_and_evict(path):
+    fd = os.open(path, os.O_RDONLY | O_BINARY)
+    try:
+        os.fsync(fd)
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def hash_file(path):
+    hasher = new_hasher()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data:
+                break
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+# Function to re-read a destination file and compare it against the hash computed while copying
+def verify_file(output_path, expected_hash):
+    flush_and_evict(output_path)
+    return hash_file(output_path) == expected_hash
+
+
+class VerificationError(Exception):
+    pass
+
+
+# Checksum manifest in the output folder, in the "<hash>  <file name>" format of b2sum/xxhsum, with one line per file
+class Manifest:
+    def __init__(self, output_folder):
+        self.manifest_path = os.path.join(output_folder, MANIFEST_FILE_NAME)
+        self.lock = threading.Lock()
+        self.hashes = {}  # file name -> hash, in file order
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest_file:
+                for line in manifest_file:
+                    file_hash, _, name = line.rstrip("\n").partition("  ")
+                    if name:
+                        self.hashes[name] = file_hash
+
+    # Function to record the hash of a copy; a file copied again gets its line replaced instead of a second one
+    def add(self, output_path, file_hash):
+        name = os.path.basename(output_path)
+        with self.lock:
+            replaced = name in self.hashes
+            self.hashes[name] = file_hash
+            if replaced:
+                self._rewrite()
+            else:
+                with open(self.manifest_path, "a") as manifest_file:
+                    manifest_file.write(f"{file_hash}  {name}\n")
+
+    # Function to drop the checksum lines of files that were removed or overwritten without verification
+    def remove(self, *output_paths):
+        with self.lock:
+            removed = [self.hashes.pop(name) for name in map(os.path.basename, output_paths) if name in self.hashes]
+            if removed:
+                self._rewrite()
+
+    def _rewrite(self):
+        with open(self.manifest_path + ".tmp", "w") as manifest_file:
+            manifest_file.writelines(f"{file_hash}  {name}\n" for name, file_hash in self.hashes.items())
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+
+# Function to drop the manifest lines of files replaced by unverified copies, whose old checksums no longer apply
+def discard_checksums(output_folder, output_paths):
+    if output_paths and os.path.exists(os.path.join(output_folder, MANIFEST_FILE_NAME)):
+        Manifest(output_folder).remove(*output_paths)
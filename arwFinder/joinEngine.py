@@ -0,0 +1,69 @@
+import os
+from timeIndex import EXACT_TOLERANCE_US, CaptureTimeIndex
+
+DEFAULT_MAX_TIME_DIFFERENCE = 60
+
+
+# Result of joining the selected .jpg files against the .arw index, in deterministic (sorted .jpg name) order
+class MatchPlan:
+    def __init__(self):
+        self.unique = []     # (jpg_file, jpg_path, jpg_creation_date, arw_path)
+        self.ambiguous = []  # (jpg_file, jpg_path, jpg_creation_date, similar_files)
+        self.missing = []    # (jpg_file, jpg_path, jpg_creation_date, reason)
+
+    def __len__(self):
+        return len(self.unique) + len(self.ambiguous) + len(self.missing)
+
+
+# Function to build the matching index in one pass over a stream of (base_name, arw_path, creation_date) tuples
+def build_arw_index(arw_stream):
+    return CaptureTimeIndex(arw_stream)
+
+
+# Function to decide one .jpg from its ranked candidates (same name first, then by time difference).
+# A candidate is accepted only when it is the only same-shot candidate with the same name (other shots further
+# away in the window do not matter). A same-shot candidate with a different name (wrapped counter, renamed file,
+# or another camera) is left ambiguous, so its preview is compared or the user confirms it.
+def classify_candidates(ranked):
+    same_shot_same_name = [entry for entry in ranked if entry[1] < EXACT_TOLERANCE_US and not entry[0]]
+    if len(same_shot_same_name) == 1:
+        return same_shot_same_name[0]
+    return None
+
+
+# Function to match the whole selection against the index with one batched window query
+def plan_matches(arw_index, selected_jpg_files, selected_jpg_folder, get_creation_date, get_base_name,
+                 max_time_difference=DEFAULT_MAX_TIME_DIFFERENCE):
+    plan = MatchPlan()
+    jpg_entries = []
+    for jpg_file in sorted(selected_jpg_files):
+        jpg_path = os.path.join(selected_jpg_folder, jpg_file)
+        jpg_entries.append((jpg_file, jpg_path, get_creation_date(jpg_path), get_base_name(jpg_file)))
+
+    dated_entries = [entry for entry in jpg_entries if entry[2] is not None]
+    windows = dict(zip((entry[0] for entry in dated_entries),
+                       arw_index.window_batch([entry[2] for entry in dated_entries], max_time_difference)))
+
+    for jpg_file, jpg_path, jpg_creation_date, base_name in jpg_entries:
+        if jpg_creation_date is None:
+            # Without a capture time only the file name is left to match on
+            same_name_paths = arw_index.paths_for_base_name(base_name) if base_name else []
+            if len(same_name_paths) == 1:
+                plan.unique.append((jpg_file, jpg_path, jpg_creation_date, same_name_paths[0]))
+            else:
+                plan.missing.append((jpg_file, jpg_path, jpg_creation_date,
+                                     f"{jpg_file} has no creation date and {len(same_name_paths)} .arw files share its name"))
+            continue
+
+        lo, hi = windows[jpg_file]
+        ranked = arw_index.candidates(jpg_creation_date, base_name, lo, hi)
+        if not ranked:
+            plan.missing.append((jpg_file, jpg_path, jpg_creation_date,
+                                 f".arw file not found for {jpg_file} with creation date {jpg_creation_date}"))
+            continue
+        match = classify_candidates(ranked)
+        if match is not None:
+            plan.unique.append((jpg_file, jpg_path, jpg_creation_date, match[2]))
+        else:
+            plan.ambiguous.append((jpg_file, jpg_path, jpg_creation_date, arw_index.similar_files(ranked)))
+    return plan
@@ -0,0 +1,68 @@
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 100000
+
+
+# Bounded in-memory LRU cache of parsed metadata, shared by worker threads.
+# Entries are validated against the file's size and mtime, so a file that changed is parsed again instead of served stale.
+class MetadataCache:
+    def __init__(self, loader, max_entries=DEFAULT_MAX_ENTRIES):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # path -> (size, mtime_ns, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Function to return the cached value for a file, loading it (outside the lock) on a miss or when the file changed
+    def get(self, path, stat_result=None):
+        try:
+            if stat_result is None:
+                stat_result = os.stat(path)
+        except OSError:
+            # Nothing to validate against: let the loader report the error and do not cache the result
+            with self.lock:
+                self.misses += 1
+            return self.loader(path)
+        key = (stat_result.st_size, stat_result.st_mtime_ns)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[:2] == key:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        value = self.loader(path)
+        with self.lock:
+            self.entries[path] = key + (value,)
+            self.entries.move_to_end(path)
+            self._evict()
+        return value
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # Function to change the size limit, evicting the least recently used entries if it shrinks
+    def resize(self, max_entries):
+        with self.lock:
+            self.max_entries = max_entries
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
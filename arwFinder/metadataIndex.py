@@ -0,0 +1,212 @@
+import os
+import sys
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".arwFinder_index.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    base_name TEXT,
+    capture_time TEXT
+)
+"""
+
+PREVIEW_HASH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS preview_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    preview_hash TEXT
+)
+"""
+
+
+# Persistent index of parsed metadata, keyed by path and validated against size, mtime and inode
+class MetadataIndex:
+    def __init__(self, index_path=DEFAULT_INDEX_PATH):
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(index_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(SCHEMA)
+        self.connection.execute(PREVIEW_HASH_SCHEMA)
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    # Function to load all index rows below a folder in one query, so a rescan only needs stat calls.
+    # Prefixes are compared with substr, as LIKE would ignore case and mix up /media/card and /media/CARD.
+    def load_folder(self, folder):
+        prefix = os.path.join(os.path.abspath(folder), "")
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT path, size, mtime_ns, inode, base_name, capture_time FROM files WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix)).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    # Function to return (base_name, capture_time) for an unchanged file, or None if it must be parsed again
+    def lookup(self, path, stat_result, cached_rows=None):
+        if cached_rows is not None:
+            row = cached_rows.get(path)
+        else:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT size, mtime_ns, inode, base_name, capture_time FROM files WHERE path = ?", (path,)).fetchone()
+        # A row without a capture time is treated as unknown, so a file that failed to parse is read again
+        if row is None or tuple(row[:3]) != (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino) \
+                or not row[4]:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return row[3], datetime.fromisoformat(row[4])
+
+    # Function to remember a parsed file; failed parses are not stored, since the error may be transient
+    def store(self, path, stat_result, base_name, capture_time):
+        if capture_time is None:
+            return
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, base_name, capture_time) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, base_name,
+                 capture_time.isoformat()))
+
+    # Function to return cached metadata or parse the file with the given functions and remember the result
+    def get_or_parse(self, path, stat_result, parse_date, parse_base_name, cached_rows=None):
+        entry = self.lookup(path, stat_result, cached_rows)
+        if entry is not None:
+            return entry
+        base_name = parse_base_name(os.path.basename(path))
+        capture_time = parse_date(path)
+        self.store(path, stat_result, base_name, capture_time)
+        return base_name, capture_time
+
+    # Function to return the cached perceptual hash of a file's preview, or None if unknown or stale
+    def get_preview_hash(self, path, stat_result):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size, mtime_ns, preview_hash FROM preview_hashes WHERE path = ?", (path,)).fetchone()
+        if row is None or tuple(row[:2]) != (stat_result.st_size, stat_result.st_mtime_ns) or row[2] is None:
+            return None
+        return int(row[2], 16)
+
+    def store_preview_hash(self, path, stat_result, preview_hash):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO preview_hashes (path, size, mtime_ns, preview_hash) VALUES (?, ?, ?, ?)",
+                (path, stat_result.st_size, stat_result.st_mtime_ns,
+                 format(preview_hash, '016x') if preview_hash is not None else None))
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+
+    # Function to remove entries for files that no longer exist (optionally only below the given folders).
+    # Folders that are not present are skipped, and without folders only files whose own folder is still there are
+    # removed, so entries of unmounted cards and offline network shares survive until the drive is back.
+    def prune(self, folders=None):
+        removed = 0
+        prefixes = None
+        if folders:
+            prefixes = []
+            for folder in folders:
+                if os.path.isdir(folder):
+                    prefixes.append(os.path.join(os.path.abspath(folder), ""))
+                else:
+                    logging.warning(f"Not pruning {folder}: folder is not present")
+                    print(f"Skipping {folder}: folder is not present (unmounted or offline?)")
+        folder_present = {}
+        with self.lock:
+            paths = [row[0] for row in self.connection.execute("SELECT path FROM files")]
+            for path in paths:
+                if prefixes is not None and not any(path.startswith(prefix) for prefix in prefixes):
+                    continue
+                if os.path.exists(path):
+                    continue
+                if prefixes is None:
+                    parent = os.path.dirname(path)
+                    if parent not in folder_present:
+                        folder_present[parent] = os.path.isdir(parent)
+                    if not folder_present[parent]:
+                        continue
+                self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+                self.connection.execute("DELETE FROM preview_hashes WHERE path = ?", (path,))
+                removed += 1
+            self.connection.commit()
+        return removed
+
+    # Function to drop entries for the given files or folders (all entries when no path is given)
+    def invalidate(self, paths=None):
+        with self.lock:
+            if not paths:
+                removed = self.connection.execute("DELETE FROM files").rowcount
+                self.connection.execute("DELETE FROM preview_hashes")
+            else:
+                removed = 0
+                for path in paths:
+                    path = os.path.abspath(path)
+                    prefix = os.path.join(path, "")
+                    removed += self.connection.execute(
+                        "DELETE FROM files WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(prefix), prefix)).rowcount
+                    self.connection.execute(
+                        "DELETE FROM preview_hashes WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(prefix), prefix))
+            self.connection.commit()
+        return removed
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+# Function to open the index, logging and continuing without it if the file cannot be used
+def open_index(index_path):
+    if not index_path or index_path.lower() == "none":
+        return None
+    try:
+        return MetadataIndex(index_path)
+    except sqlite3.Error as e:
+        logging.error(f"Cannot open metadata index {index_path}: {e}")
+        print(f"Metadata index {index_path} could not be opened, continuing without it.")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the arwFinder metadata index")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Path to the index file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    prune_parser = subparsers.add_parser("prune", help="Remove entries for deleted files")
+    prune_parser.add_argument("folders", nargs="*",
+                              help="Only prune entries below these folders (default: files whose folder is still present)")
+    invalidate_parser = subparsers.add_parser("invalidate", help="Drop entries so they are parsed again")
+    invalidate_parser.add_argument("paths", nargs="*", help="Files or folders to drop (all entries if omitted)")
+    subparsers.add_parser("stats", help="Show the number of indexed files")
+    args = parser.parse_args()
+
+    index = MetadataIndex(args.index)
+    if args.command == "prune":
+        print(f"Removed {index.prune(args.folders)} entries for deleted files")
+    elif args.command == "invalidate":
+        print(f"Invalidated {index.invalidate(args.paths)} entries")
+    else:
+        print(f"{index.count()} files indexed in {args.index}")
+    index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import time
+import heapq
+import logging
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from tabulate import tabulate
+
+DEFAULT_REPORT_FILE_NAME = "performance_report.json"
+PROFILE_MODES = ("cprofile", "tracemalloc")
+PROFILE_FILE_PREFIX = "profile"
+SLOWEST_FILES = 10
+TRACEMALLOC_TOP = 25
+
+
+# Counters of one stage. wall_seconds comes from stage() blocks, file_seconds is the sum of the per-file times
+# recorded with record_file() (summed across threads, so it can exceed the wall time).
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.file_seconds = 0.0
+        self.files = 0
+        self.bytes = 0
+        self.slowest = []  # min-heap of (seconds, path), at most SLOWEST_FILES entries
+        self.extra = {}
+
+    def to_dict(self):
+        seconds = self.wall_seconds or self.file_seconds
+        return {
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "cpu_utilization": round(self.cpu_seconds / self.wall_seconds, 3) if self.wall_seconds else None,
+            "file_seconds": round(self.file_seconds, 6),
+            "files": self.files,
+            "bytes": self.bytes,
+            "files_per_s": round(self.files / seconds, 1) if seconds else None,
+            "mb_per_s": round(self.bytes / 1024 / 1024 / seconds, 1) if seconds and self.bytes else None,
+            "slowest": [{"path": path, "seconds": round(elapsed, 6)} for elapsed, path in sorted(self.slowest, reverse=True)],
+            **self.extra,
+        }
+
+
+# Per-stage instrumentation of one run (wall/CPU time, files, bytes, throughput, slowest files, cache hit rates)
+class PerfReport:
+    def __init__(self, slowest_files=SLOWEST_FILES):
+        self.slowest_files = slowest_files
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.caches = {}
+            self.memory = None
+            self.started = time.time()
+
+    def _stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageStats(name)
+        return self.stages[name]
+
+    # Context manager timing a block of work; CPU time is process-wide, so it includes every thread of the process
+    @contextmanager
+    def stage(self, name):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            with self.lock:
+                stats = self._stage(name)
+                stats.wall_seconds += wall
+                stats.cpu_seconds += cpu
+
+    def add(self, name, files=0, bytes=0, **extra):
+        with self.lock:
+            stats = self._stage(name)
+            stats.files += files
+            stats.bytes += bytes
+            stats.extra.update(extra)
+
+    # Function to record the time spent on one file (or folder), keeping only the slowest ones
+    def record_file(self, name, path, seconds, count=True):
+        with self.lock:
+            stats = self._stage(name)
+            stats.file_seconds += seconds
+            if count:
+                stats.files += 1
+            if len(stats.slowest) < self.slowest_files:
+                heapq.heappush(stats.slowest, (seconds, path))
+            elif seconds > stats.slowest[0][0]:
+                heapq.heapreplace(stats.slowest, (seconds, path))
+
+    def set_cache(self, name, hits, misses, **extra):
+        lookups = hits + misses
+        with self.lock:
+            self.caches[name] = {"hits": hits, "misses": misses,
+                                 "hit_rate": round(hits / lookups, 4) if lookups else None, **extra}
+
+    def to_dict(self):
+        with self.lock:
+            report = {
+                "started": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                "total_seconds": round(time.time() - self.started, 3),
+                "stages": {name: stats.to_dict() for name, stats in self.stages.items()},
+                "caches": dict(self.caches),
+            }
+            if self.memory is not None:
+                report["memory"] = self.memory
+        return report
+
+    def write(self, report_path):
+        with open(report_path, "w") as report_file:
+            json.dump(self.to_dict(), report_file, indent=2)
+        return report_path
+
+
+# Function to format the stages of a report dict as a table
+def format_report(report):
+    rows = []
+    for name, stats in report["stages"].items():
+        rows.append([name, f"{stats['wall_seconds']:.3f}" if stats["wall_seconds"] else "-",
+                     f"{stats['file_seconds']:.3f}" if stats["file_seconds"] else "-",
+                     stats["files"], f"{stats['bytes'] / 1024 / 1024:.1f}", stats["files_per_s"] or "-", stats["mb_per_s"] or "-"])
+    table = tabulate(rows, headers=["Stage", "Wall s", "Per-file s", "Files", "MB", "Files/s", "MB/s"])
+    for name, cache in report["caches"].items():
+        hit_rate = f"{cache['hit_rate'] * 100:.1f}%" if cache["hit_rate"] is not None else "-"
+        table += f"\n{name}: {cache['hits']} hits, {cache['misses']} misses ({hit_rate})"
+    return table
+
+
+# Context manager for deep dives: "cprofile" writes <output_prefix>.prof (calling thread only, open with pstats or
+# snakeviz), "tracemalloc" writes the top allocation sites to <output_prefix>.tracemalloc.txt and the peak to the report
+@contextmanager
+def profile_session(mode, output_prefix, report=None):
+    if mode is None:
+        yield
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}'. Choose one of: {', '.join(PROFILE_MODES)}")
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(output_prefix + ".prof")
+            logging.info(f"cProfile statistics written to {output_prefix}.prof")
+        return
+
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        top_stats = snapshot.statistics('lineno')[:TRACEMALLOC_TOP]
+        with open(output_prefix + ".tracemalloc.txt", "w") as trace_file:
+            trace_file.write(f"Current: {current / 1024 / 1024:.1f} MB, peak: {peak / 1024 / 1024:.1f} MB\n\n")
+            trace_file.writelines(f"{stat}\n" for stat in top_stats)
+        if report is not None:
+            report.memory = {"current_bytes": current, "peak_bytes": peak,
+                             "top": [{"location": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                                     for stat in top_stats]}
+        logging.info(f"tracemalloc statistics written to {output_prefix}.tracemalloc.txt")
+
+
+if __name__ == "__main__":
+    for report_path in sys.argv[1:]:
+        with open(report_path) as report_file:
+            print(f"{os.path.basename(report_path)}:\n{format_report(json.load(report_file))}\n")
@@ -0,0 +1,169 @@
+import io
+import os
+import struct
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from fastExif import ExifFormatError, WindowReader, read_ifd, read_tiff_header
+
+# Pillow (JPEG decoding) is optional; without it ambiguous matches are left for the user as before
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# NumPy is optional; without it Hamming distances are computed one pair at a time
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TAG_JPEG_OFFSET = 0x0201
+TAG_JPEG_LENGTH = 0x0202
+TAG_SUB_IFDS = 0x014A
+MAX_IFDS = 16
+HASH_SIZE = 8  # 8x8 difference hash, 64 bits
+
+DEFAULT_MAX_DISTANCE = 10  # Best candidate must be at most this many bits away from the .jpg
+DEFAULT_MIN_MARGIN = 8     # ... and at least this many bits closer than the runner-up
+
+
+def is_available():
+    return Image is not None
+
+
+# Function to find the largest embedded JPEG preview in an .arw file, walking the IFD chain and its SubIFDs
+def extract_preview(arw_path):
+    with open(arw_path, 'rb') as f:
+        reader = WindowReader(f)
+        byte_order, ifd_offset = read_tiff_header(reader)
+        best = None
+        pending = [ifd_offset]
+        visited = set()
+        while pending and len(visited) < MAX_IFDS:
+            offset = pending.pop(0)
+            if offset == 0 or offset in visited:
+                continue
+            visited.add(offset)
+            entries = read_ifd(reader, offset, byte_order)
+            if TAG_JPEG_OFFSET in entries and TAG_JPEG_LENGTH in entries:
+                preview_offset = struct.unpack(byte_order + 'I', entries[TAG_JPEG_OFFSET][2])[0]
+                preview_length = struct.unpack(byte_order + 'I', entries[TAG_JPEG_LENGTH][2])[0]
+                if best is None or preview_length > best[1]:
+                    best = (preview_offset, preview_length)
+            if TAG_SUB_IFDS in entries:
+                value_type, count, raw_value = entries[TAG_SUB_IFDS]
+                if count == 1:
+                    pending.append(struct.unpack(byte_order + 'I', raw_value)[0])
+                else:
+                    pending.extend(struct.unpack(byte_order + 'I' * count, reader.read_at(
+                        struct.unpack(byte_order + 'I', raw_value)[0], 4 * count)))
+            entry_count = len(entries)
+            pending.append(struct.unpack(byte_order + 'I', reader.read_at(offset + 2 + 12 * entry_count, 4))[0])
+        if best is None:
+            raise ExifFormatError("No embedded JPEG preview")
+        data = reader.read_at(*best)
+    if data[:2] != b'\xff\xd8':
+        raise ExifFormatError("Embedded preview is not a JPEG")
+    return data
+
+
+# Function to compute a 64-bit difference hash; draft mode lets the JPEG decoder downscale while decoding
+def difference_hash(image):
+    image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+    pixels = list(image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE)).getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + column]
+            right = pixels[row * (HASH_SIZE + 1) + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+# Worker function run in a separate process: hash an .arw preview or a .jpg; None if it cannot be decoded
+def compute_preview_hash(path):
+    try:
+        if path.lower().endswith('.arw'):
+            image = Image.open(io.BytesIO(extract_preview(path)))
+        else:
+            image = Image.open(path)
+        return difference_hash(image)
+    except Exception as e:
+        logging.warning(f"Cannot compute preview hash for {path}: {e}")
+        return None
+
+
+# Function to hash all paths in a process pool, serving unchanged files from the metadata index
+def compute_preview_hashes(paths, num_workers, index=None):
+    hashes = {}
+    stats = {}
+    pending = []
+    for path in sorted(set(paths)):
+        if index is not None:
+            try:
+                stats[path] = os.stat(path)
+            except OSError:
+                hashes[path] = None
+                continue
+            cached_hash = index.get_preview_hash(path, stats[path])
+            if cached_hash is not None:
+                hashes[path] = cached_hash
+                continue
+        pending.append(path)
+    if pending:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            for path, preview_hash in zip(pending, executor.map(compute_preview_hash, pending, chunksize=8)):
+                hashes[path] = preview_hash
+                if index is not None and preview_hash is not None:
+                    index.store_preview_hash(path, stats[path], preview_hash)
+        if index is not None:
+            index.commit()
+    return hashes
+
+
+# Function to compute Hamming distances for many (hash, hash) pairs at once
+def hamming_distances(left_hashes, right_hashes):
+    if np is None:
+        return [bin(left ^ right).count('1') for left, right in zip(left_hashes, right_hashes)]
+    xor = np.array(left_hashes, dtype=np.uint64) ^ np.array(right_hashes, dtype=np.uint64)
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1).tolist()
+
+
+# Function to resolve ambiguous matches automatically; returns (resolved, still_ambiguous).
+# resolved entries are (jpg_file, jpg_path, jpg_creation_date, arw_path, distance).
+def resolve_ambiguous(ambiguous, num_workers, index=None, max_distance=DEFAULT_MAX_DISTANCE, min_margin=DEFAULT_MIN_MARGIN):
+    if not ambiguous or not is_available():
+        return [], list(ambiguous)
+    paths = [entry[1] for entry in ambiguous]
+    for entry in ambiguous:
+        paths.extend(sim_path for sim_path, _, _ in entry[3])
+    hashes = compute_preview_hashes(paths, num_workers, index)
+
+    # Flatten every (jpg, candidate) pair with both hashes known into one batch
+    pair_owner = []
+    left_hashes = []
+    right_hashes = []
+    for case_number, (jpg_file, jpg_path, jpg_creation_date, similar_files) in enumerate(ambiguous):
+        if hashes.get(jpg_path) is None:
+            continue
+        for sim_path, _, _ in similar_files:
+            if hashes.get(sim_path) is not None:
+                pair_owner.append((case_number, sim_path))
+                left_hashes.append(hashes[jpg_path])
+                right_hashes.append(hashes[sim_path])
+    distances = {}
+    for (case_number, sim_path), distance in zip(pair_owner, hamming_distances(left_hashes, right_hashes) if pair_owner else []):
+        distances.setdefault(case_number, []).append((distance, sim_path))
+
+    resolved = []
+    remaining = []
+    for case_number, entry in enumerate(ambiguous):
+        ranked = sorted(distances.get(case_number, []))
+        # Candidates whose preview could not be hashed count as perfect runner-ups, so they block an automatic choice
+        unhashed = len(entry[3]) - len(ranked)
+        runner_up = 0 if unhashed else (ranked[1][0] if len(ranked) > 1 else 64)
+        if ranked and ranked[0][0] <= max_distance and runner_up - ranked[0][0] >= min_margin:
+            resolved.append((entry[0], entry[1], entry[2], ranked[0][1], ranked[0][0]))
+        else:
+            remaining.append(entry)
+    return resolved, remaining
@@ -0,0 +1,97 @@
+import os
+import csv
+import json
+import logging
+from datetime import datetime
+
+DEFAULT_RESOLUTION_FILE_NAME = "resolutions.json"
+CSV_FIELDS = ["output_folder", "jpg_file", "jpg_path", "jpg_creation_date", "option",
+              "candidate_path", "candidate_creation_date", "time_difference", "choice"]
+INSTRUCTIONS = ("For each case set 'choice' to the option number of the correct .arw file or to its full path, "
+                "then run: python arwFinderBatch.py --apply-resolutions <this file>")
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+# Function to write the ambiguous matches to a JSON (default) or CSV resolution file for later review
+def write_resolution_file(resolution_path, ambiguous, output_folder):
+    if resolution_path.lower().endswith(".csv"):
+        # One row per candidate; mark the correct one by putting any value in its "choice" column
+        with open(resolution_path, "w", newline="") as resolution_file:
+            writer = csv.DictWriter(resolution_file, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for jpg_file, jpg_path, jpg_creation_date, similar_files in ambiguous:
+                for option, (sim_path, sim_date, time_diff) in enumerate(similar_files, 1):
+                    writer.writerow({"output_folder": output_folder, "jpg_file": jpg_file, "jpg_path": jpg_path,
+                                     "jpg_creation_date": _isoformat(jpg_creation_date), "option": option,
+                                     "candidate_path": sim_path, "candidate_creation_date": _isoformat(sim_date),
+                                     "time_difference": f"{time_diff:.6f}", "choice": ""})
+        return
+
+    cases = []
+    for jpg_file, jpg_path, jpg_creation_date, similar_files in ambiguous:
+        cases.append({
+            "jpg_file": jpg_file,
+            "jpg_path": jpg_path,
+            "jpg_creation_date": _isoformat(jpg_creation_date),
+            "candidates": [{"option": option, "path": sim_path, "creation_date": _isoformat(sim_date), "time_difference": time_diff}
+                           for option, (sim_path, sim_date, time_diff) in enumerate(similar_files, 1)],
+            "choice": None,
+        })
+    document = {
+        "instructions": INSTRUCTIONS,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "output_folder": output_folder,
+        "cases": cases,
+    }
+    with open(resolution_path, "w") as resolution_file:
+        json.dump(document, resolution_file, indent=2)
+
+
+# Function to turn a recorded choice (option number or path) into an .arw path, or None if it is not usable
+def _resolve_choice(jpg_file, choice, candidate_paths):
+    if choice is None or str(choice).strip() == "":
+        return None
+    choice = str(choice).strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(candidate_paths):
+        return candidate_paths[int(choice) - 1]
+    if os.path.exists(choice):
+        return os.path.abspath(choice)
+    logging.warning(f"Ignoring invalid choice '{choice}' for {jpg_file}")
+    return None
+
+
+# Function to read a resolution file; returns (output_folder, [(jpg_file, arw_path)], [unresolved jpg_file])
+def read_resolution_file(resolution_path):
+    choices = []
+    unresolved = []
+    if resolution_path.lower().endswith(".csv"):
+        cases = {}
+        output_folder = None
+        with open(resolution_path, newline="") as resolution_file:
+            for row in csv.DictReader(resolution_file):
+                output_folder = output_folder or row["output_folder"]
+                case = cases.setdefault(row["jpg_file"], {"candidates": [], "choice": None})
+                case["candidates"].append(row["candidate_path"])
+                if (row.get("choice") or "").strip():
+                    case["choice"] = row["option"]
+        for jpg_file, case in cases.items():
+            arw_path = _resolve_choice(jpg_file, case["choice"], case["candidates"])
+            if arw_path is None:
+                unresolved.append(jpg_file)
+            else:
+                choices.append((jpg_file, arw_path))
+        return output_folder, choices, unresolved
+
+    with open(resolution_path) as resolution_file:
+        document = json.load(resolution_file)
+    for case in document["cases"]:
+        candidate_paths = [candidate["path"] for candidate in case["candidates"]]
+        arw_path = _resolve_choice(case["jpg_file"], case.get("choice"), candidate_paths)
+        if arw_path is None:
+            unresolved.append(case["jpg_file"])
+        else:
+            choices.append((case["jpg_file"], arw_path))
+    return document.get("output_folder"), choices, unresolved
@@ -0,0 +1,189 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+from fastExif import read_creation_date
+from deviceScheduler import DeviceQueue, device_of
+
+SCAN_ENGINES = ("thread", "process", "async")
+DEFAULT_CHUNK_SIZE = 64
+DEFAULT_SCAN_CONCURRENCY = 64  # Directory listings and header reads in flight per device with the async engine
+
+
+# Function to enumerate .arw files in an SD card folder without touching their contents
+def enumerate_arw_paths(sd_folder):
+    for root, _, files in os.walk(sd_folder):
+        for file in files:
+            if file.lower().endswith('.arw'):
+                yield os.path.join(root, file)
+
+
+def chunked(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Worker function run in a separate process: parse the EXIF creation date of a chunk of files
+def parse_arw_chunk(paths):
+    return [(path, read_creation_date(path)) for path in paths]
+
+
+# Process-pool scanning engine: enumerate in the main process, fan EXIF parsing out to worker processes in chunks.
+# Chunks are submitted round-robin across devices. Parsing is CPU bound, so the per-device limit meant for I/O is not
+# applied: a single card keeps every worker busy.
+def scan_folders_process(sd_folders, parse_base_name, num_workers, index=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    arw_files = []
+    device_queue = DeviceQueue(2 * num_workers)
+    stats = {}
+    pending_count = 0
+
+    # Enumerate all folders first; files unchanged since the last run are answered from the index
+    for sd_folder in sd_folders:
+        device = device_of(sd_folder)
+        cached_rows = index.load_folder(sd_folder) if index is not None else None
+        pending = []
+        for arw_path in enumerate_arw_paths(sd_folder):
+            if index is not None:
+                try:
+                    stat_result = os.stat(arw_path)
+                except OSError as e:
+                    logging.error(f"Error reading metadata from {arw_path}: {e}")
+                    continue
+                entry = index.lookup(arw_path, stat_result, cached_rows)
+                if entry is not None:
+                    base_name, creation_date = entry
+                    if creation_date:
+                        arw_files.append((base_name, arw_path, creation_date))
+                    continue
+                stats[arw_path] = stat_result
+            pending.append(arw_path)
+        for chunk in chunked(pending, chunk_size):
+            device_queue.put(device, chunk)
+        pending_count += len(pending)
+    device_queue.close()
+
+    if pending_count:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor, \
+                tqdm(total=pending_count, desc="Parsing EXIF", unit="file") as progress:
+            in_flight = {}
+            while True:
+                # Keep every worker busy plus one queued chunk each
+                while len(in_flight) < 2 * num_workers:
+                    taken = device_queue.get(block=False)
+                    if taken is None:
+                        break
+                    device, chunk = taken
+                    in_flight[executor.submit(parse_arw_chunk, chunk)] = device
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    device_queue.release(in_flight.pop(future))
+                    results = future.result()
+                    for arw_path, creation_date in results:
+                        base_name = parse_base_name(os.path.basename(arw_path))
+                        if index is not None:
+                            index.store(arw_path, stats[arw_path], base_name, creation_date)
+                        if creation_date:
+                            arw_files.append((base_name, arw_path, creation_date))
+                    progress.update(len(results))
+    if index is not None:
+        index.commit()
+    return arw_files
+
+
+# Function to list one directory with os.scandir: returns (subfolders, [(arw_path, stat_result or None)]).
+# The stat data come from the DirEntry cache where the platform provides it, and are only fetched when needed.
+def list_directory(folder, with_stat):
+    subfolders = []
+    files = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.path)
+                elif entry.name.lower().endswith('.arw'):
+                    files.append((entry.path, entry.stat() if with_stat else None))
+            except OSError as e:
+                logging.error(f"Error reading metadata from {entry.path}: {e}")
+    return subfolders, files
+
+
+async def _scan_folders_async(sd_folders, parse_base_name, concurrency, index, parse_date):
+    loop = asyncio.get_running_loop()
+    arw_files = []
+    folders_by_device = {}
+    for sd_folder in sd_folders:
+        folders_by_device.setdefault(device_of(sd_folder), []).append(sd_folder)
+
+    # Each device gets its own work queue and `concurrency` worker coroutines, so a slow mount does not hold back
+    # the others; the blocking scandir/open calls run in a shared thread pool sized for all of them
+    executor = ThreadPoolExecutor(max_workers=concurrency * len(folders_by_device))
+    with tqdm(desc="Scanning (async)", unit="file") as progress:
+        async def worker(work_queue):
+            while True:
+                is_folder, path, extra = await work_queue.get()
+                try:
+                    if is_folder:
+                        subfolders, files = await loop.run_in_executor(executor, list_directory, path, index is not None)
+                        for subfolder in subfolders:
+                            work_queue.put_nowait((True, subfolder, extra))
+                        for arw_path, stat_result in files:
+                            # Files unchanged since the last run are answered from the index without opening them
+                            entry = index.lookup(arw_path, stat_result, extra) if index is not None else None
+                            if entry is None:
+                                work_queue.put_nowait((False, arw_path, stat_result))
+                                continue
+                            base_name, creation_date = entry
+                            if creation_date:
+                                arw_files.append((base_name, arw_path, creation_date))
+                            progress.update(1)
+                    else:
+                        creation_date = await loop.run_in_executor(executor, parse_date, path)
+                        base_name = parse_base_name(os.path.basename(path))
+                        if index is not None:
+                            index.store(path, extra, base_name, creation_date)
+                        if creation_date:
+                            arw_files.append((base_name, path, creation_date))
+                        progress.update(1)
+                except Exception as e:
+                    # Any failure (I/O, a locked index, a parser error) is logged and skipped; a dead worker would
+                    # leave its queue unfinished and the scan waiting forever
+                    logging.error(f"Error scanning {path}: {e}")
+                finally:
+                    work_queue.task_done()
+
+        work_queues = []
+        workers = []
+        for folders in folders_by_device.values():
+            work_queue = asyncio.Queue()
+            for sd_folder in folders:
+                work_queue.put_nowait((True, sd_folder, index.load_folder(sd_folder) if index is not None else None))
+            work_queues.append(work_queue)
+            workers.extend(asyncio.create_task(worker(work_queue)) for _ in range(concurrency))
+        try:
+            await asyncio.gather(*(work_queue.join() for work_queue in work_queues))
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            executor.shutdown(wait=True)
+    return arw_files
+
+
+# Asyncio scanning engine for latency-bound mounts (SMB/NFS, USB readers): directory listings and small header
+# reads are kept in flight concurrently, up to `concurrency` per device, so round trips overlap instead of adding up.
+# parse_date runs in worker threads and must be thread-safe.
+def scan_folders_async(sd_folders, parse_base_name, concurrency=DEFAULT_SCAN_CONCURRENCY, index=None,
+                       parse_date=read_creation_date):
+    arw_files = asyncio.run(_scan_folders_async(sd_folders, parse_base_name, concurrency, index, parse_date))
+    if index is not None:
+        index.commit()
+    return arw_files
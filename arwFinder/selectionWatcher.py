@@ -0,0 +1,148 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+DEFAULT_POLL_INTERVAL = 0.5
+
+# inotify flags from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+# Events returned by the watchers: ("added", name), ("removed", name), or ("resync", None) when events may have
+# been lost and the caller should compare the folder listing with what it knows
+ADDED = "added"
+REMOVED = "removed"
+RESYNC = "resync"
+
+
+def is_selected_file(name):
+    return name.lower().endswith('.jpg') and not name.startswith('.')
+
+
+# Watcher based on Linux inotify through ctypes: a file is reported once it is closed after writing or moved in,
+# so half-copied .jpg files are never picked up
+class InotifyWatcher:
+    def __init__(self, folder):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError(errno.ENOSYS, "libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.folder = folder
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch failed for {folder}")
+
+    # Function to wait up to timeout seconds for events and return them in order
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        position = 0
+        while position + EVENT_HEADER.size <= len(data):
+            _, mask, _, name_length = EVENT_HEADER.unpack_from(data, position)
+            position += EVENT_HEADER.size
+            name = os.fsdecode(data[position:position + name_length].rstrip(b'\x00'))
+            position += name_length
+            if mask & IN_Q_OVERFLOW:
+                events.append((RESYNC, None))
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                raise OSError(errno.ENOENT, f"Watched folder {self.folder} was removed or moved")
+            elif mask & IN_ISDIR or not is_selected_file(name):
+                continue
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                events.append((ADDED, name))
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                events.append((REMOVED, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+# Portable fallback: compare folder listings every poll_interval seconds. A new or changed file is reported once its
+# size and mtime are the same in two consecutive polls, so files still being copied are not picked up too early.
+class PollingWatcher:
+    def __init__(self, folder, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.folder = folder
+        self.poll_interval = poll_interval
+        self.known = self._listing()
+        self.unstable = {}
+        self.next_poll = time.monotonic() + poll_interval
+
+    def _listing(self):
+        listing = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if is_selected_file(entry.name):
+                    try:
+                        stat_result = entry.stat()
+                    except OSError:
+                        continue
+                    listing[entry.name] = (stat_result.st_size, stat_result.st_mtime_ns)
+        return listing
+
+    def wait(self, timeout):
+        delay = self.next_poll - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return []
+        if delay > 0:
+            time.sleep(delay)
+        self.next_poll = time.monotonic() + self.poll_interval
+        current = self._listing()
+        events = [(REMOVED, name) for name in sorted(self.known.keys() - current.keys())]
+        for name in sorted(current):
+            if current[name] == self.known.get(name):
+                continue
+            if self.unstable.get(name) == current[name]:
+                events.append((ADDED, name))
+                self.known[name] = current[name]
+                del self.unstable[name]
+            else:
+                self.unstable[name] = current[name]
+        for name in self.known.keys() - current.keys():
+            del self.known[name]
+        for name in self.unstable.keys() - current.keys():
+            del self.unstable[name]
+        return events
+
+    def close(self):
+        pass
+
+
+# Function to create an inotify watcher, or a polling watcher where inotify is unavailable (or force_polling is set,
+# e.g. for network shares, where inotify does not see changes made by other machines)
+def create_watcher(folder, poll_interval=DEFAULT_POLL_INTERVAL, force_polling=False):
+    if not force_polling:
+        try:
+            return InotifyWatcher(folder)
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify unavailable for {folder} ({e}), polling every {poll_interval} seconds")
+    return PollingWatcher(folder, poll_interval)
@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import random
+import shutil
+import struct
+import argparse
+from datetime import datetime, timedelta
+
+DATASET_FILE_NAME = "dataset.json"
+DATASET_VERSION = 1
+BASE_TIME = datetime(2024, 5, 1, 9, 0, 0)
+MAX_COUNTER = 9999
+DEFAULT_FILES_PER_FOLDER = 1000
+DEFAULT_ARW_SIZE = 1024 * 1024
+DEFAULT_SELECTION_RATIO = 0.1
+PAD_CHUNK = 1024 * 1024
+
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_EXIF_IFD_POINTER = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_SUBSEC_TIME_ORIGINAL = 0x9291
+TYPE_ASCII = 2
+TYPE_LONG = 4
+
+
+# Function to build a minimal valid TIFF structure: IFD0 (Make, Model, EXIF pointer) and an EXIF IFD with
+# DateTimeOriginal and SubSecTimeOriginal, readable by both fastExif and exifread
+def build_tiff_header(capture_time, byte_order='<', make="SONY", model="ILCE-7M3"):
+    make_value = make.encode() + b'\x00'
+    model_value = model.encode() + b'\x00'
+    date_value = capture_time.strftime('%Y:%m:%d %H:%M:%S').encode() + b'\x00'
+    subsec_value = f"{capture_time.microsecond // 1000:03d}".encode() + b'\x00'
+
+    ifd0_offset = 8
+    exif_offset = ifd0_offset + 2 + 3 * 12 + 4
+    data_offset = exif_offset + 2 + 2 * 12 + 4
+    make_offset = data_offset
+    model_offset = make_offset + len(make_value)
+    date_offset = model_offset + len(model_value)
+
+    header = (b'II' if byte_order == '<' else b'MM') + struct.pack(byte_order + 'HI', 42, ifd0_offset)
+    ifd0 = struct.pack(byte_order + 'H', 3)
+    ifd0 += struct.pack(byte_order + 'HHII', TAG_MAKE, TYPE_ASCII, len(make_value), make_offset)
+    ifd0 += struct.pack(byte_order + 'HHII', TAG_MODEL, TYPE_ASCII, len(model_value), model_offset)
+    ifd0 += struct.pack(byte_order + 'HHII', TAG_EXIF_IFD_POINTER, TYPE_LONG, 1, exif_offset)
+    ifd0 += struct.pack(byte_order + 'I', 0)
+    exif = struct.pack(byte_order + 'H', 2)
+    exif += struct.pack(byte_order + 'HHII', TAG_DATETIME_ORIGINAL, TYPE_ASCII, len(date_value), date_offset)
+    exif += struct.pack(byte_order + 'HHI', TAG_SUBSEC_TIME_ORIGINAL, TYPE_ASCII, len(subsec_value)) + subsec_value
+    exif += struct.pack(byte_order + 'I', 0)
+    return header + ifd0 + exif + make_value + model_value + date_value
+
+
+# Function to wrap a TIFF structure in a minimal JPG (SOI, APP1 "Exif" segment, EOI)
+def build_jpg(tiff_header):
+    app1 = b'Exif\x00\x00' + tiff_header
+    return b'\xff\xd8' + b'\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1 + b'\xff\xd9'
+
+
+# Function to write a file padded to size bytes; sparse files keep large datasets cheap, dense ones stress the disk
+def write_padded(path, data, size, dense=False):
+    with open(path, 'wb') as f:
+        f.write(data)
+        if dense:
+            remaining = size - len(data)
+            while remaining > 0:
+                chunk = min(remaining, PAD_CHUNK)
+                f.write(b'\x00' * chunk)
+                remaining -= chunk
+        elif size > len(data):
+            f.truncate(size)
+
+
+# Function to generate the capture times of one card: mostly single shots a few seconds apart, with bursts of
+# several frames inside the same second (told apart only by SubSecTimeOriginal)
+def capture_times(rng, count, start_time):
+    times = []
+    current = start_time
+    while len(times) < count:
+        if rng.random() < 0.1:
+            burst = rng.randint(2, 5)
+            for frame in range(min(burst, count - len(times))):
+                times.append(current + timedelta(milliseconds=100 * frame))
+            current += timedelta(seconds=1)
+        else:
+            times.append(current)
+        current += timedelta(seconds=rng.randint(2, 30))
+    return times
+
+
+# Function to write one SD card: DCIM/1xxMSDCF folders, the _DSC counter wrapping from 9999 to 0001 (which also
+# starts a new folder, as the cameras do), and an .arw/.jpg pair per shot. Returns [(arw_path, jpg_path, capture_time)].
+def generate_card(card_folder, count, start_counter, start_time, rng, files_per_folder=DEFAULT_FILES_PER_FOLDER,
+                  arw_size=DEFAULT_ARW_SIZE, dense=False):
+    shots = []
+    folder_number = 100
+    in_folder = 0
+    counter = start_counter
+    folder = None
+    for capture_time in capture_times(rng, count, start_time):
+        if folder is None or in_folder >= files_per_folder:
+            folder = os.path.join(card_folder, "DCIM", f"{folder_number}MSDCF")
+            os.makedirs(folder, exist_ok=True)
+            folder_number += 1
+            in_folder = 0
+        tiff_header = build_tiff_header(capture_time)
+        arw_path = os.path.join(folder, f"_DSC{counter:04d}.ARW")
+        jpg_path = os.path.join(folder, f"_DSC{counter:04d}.JPG")
+        write_padded(arw_path, tiff_header, arw_size, dense)
+        with open(jpg_path, 'wb') as f:
+            f.write(build_jpg(tiff_header))
+        shots.append((arw_path, jpg_path, capture_time))
+        in_folder += 1
+        counter += 1
+        if counter > MAX_COUNTER:
+            counter = 1
+            in_folder = files_per_folder
+    return shots
+
+
+# Function to generate a dataset of num_files shots spread over num_cards cards, plus a selection folder with a
+# sample of the .jpg files. The first card wraps its counter mid-card and the second restarts at 0001, so counters
+# repeat across cards; selected .jpg files with clashing names are renamed ("_DSC0001 (2).JPG"), as a file manager would.
+# Everything is derived from the seed, and dataset.json records the parameters and the expected .jpg -> .arw matches.
+def generate_dataset(root, num_files, num_cards=2, seed=0, selection_ratio=DEFAULT_SELECTION_RATIO,
+                     files_per_folder=DEFAULT_FILES_PER_FOLDER, arw_size=DEFAULT_ARW_SIZE, dense=False):
+    rng = random.Random(seed)
+    card_folders = [os.path.join(root, f"card{card + 1}") for card in range(num_cards)]
+    selection_folder = os.path.join(root, "selection")
+    os.makedirs(selection_folder, exist_ok=True)
+
+    shots = []
+    per_card = [num_files // num_cards + (1 if card < num_files % num_cards else 0) for card in range(num_cards)]
+    for card, (card_folder, count) in enumerate(zip(card_folders, per_card)):
+        if card == 0:
+            start_counter = max(1, MAX_COUNTER - count // 2 + 1)
+        elif card == 1:
+            start_counter = 1
+        else:
+            start_counter = rng.randint(1, MAX_COUNTER)
+        start_time = BASE_TIME + timedelta(days=card, minutes=rng.randint(0, 120))
+        shots.extend(generate_card(card_folder, count, start_counter, start_time, rng, files_per_folder, arw_size, dense))
+
+    expected = {}
+    for arw_path, jpg_path, capture_time in rng.sample(shots, max(1, int(len(shots) * selection_ratio))):
+        stem, extension = os.path.splitext(os.path.basename(jpg_path))
+        name = stem + extension
+        copy_number = 2
+        while name in expected:
+            name = f"{stem} ({copy_number}){extension}"
+            copy_number += 1
+        with open(jpg_path, 'rb') as source, open(os.path.join(selection_folder, name), 'wb') as target:
+            target.write(source.read())
+        expected[name] = arw_path
+
+    dataset = {
+        "version": DATASET_VERSION,
+        "parameters": {"num_files": num_files, "num_cards": num_cards, "seed": seed, "selection_ratio": selection_ratio,
+                       "files_per_folder": files_per_folder, "arw_size": arw_size, "dense": dense},
+        "card_folders": card_folders,
+        "selection_folder": selection_folder,
+        "arw_bytes": arw_size * len(shots),
+        "expected_matches": expected,
+    }
+    with open(os.path.join(root, DATASET_FILE_NAME), "w") as dataset_file:
+        json.dump(dataset, dataset_file, indent=2)
+    return dataset
+
+
+# Function to reuse a dataset generated earlier with the same parameters, or (re)generate it
+def load_or_generate_dataset(root, num_files, num_cards=2, seed=0, selection_ratio=DEFAULT_SELECTION_RATIO,
+                             files_per_folder=DEFAULT_FILES_PER_FOLDER, arw_size=DEFAULT_ARW_SIZE, dense=False):
+    parameters = {"num_files": num_files, "num_cards": num_cards, "seed": seed, "selection_ratio": selection_ratio,
+                  "files_per_folder": files_per_folder, "arw_size": arw_size, "dense": dense}
+    dataset_path = os.path.join(root, DATASET_FILE_NAME)
+    if os.path.exists(dataset_path):
+        with open(dataset_path) as dataset_file:
+            dataset = json.load(dataset_file)
+        if dataset.get("version") == DATASET_VERSION and dataset["parameters"] == parameters:
+            return dataset
+        # Only folders recorded by an earlier generation are removed
+        for folder in dataset["card_folders"] + [dataset["selection_folder"]]:
+            shutil.rmtree(folder, ignore_errors=True)
+    return generate_dataset(root, **parameters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic SD card dumps for benchmarks")
+    parser.add_argument("root", help="Folder to create the cards and the selection in")
+    parser.add_argument("--files", type=int, default=1000, help="Number of shots (.arw/.jpg pairs)")
+    parser.add_argument("--cards", type=int, default=2, help="Number of SD cards")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--selection-ratio", type=float, default=DEFAULT_SELECTION_RATIO, help="Fraction of .jpg files selected")
+    parser.add_argument("--files-per-folder", type=int, default=DEFAULT_FILES_PER_FOLDER, help="Shots per DCIM subfolder")
+    parser.add_argument("--arw-size", type=int, default=DEFAULT_ARW_SIZE, help="Size of each .arw file in bytes")
+    parser.add_argument("--dense", action="store_true", help="Write the .arw padding instead of creating sparse files")
+    args = parser.parse_args()
+    dataset = generate_dataset(args.root, args.files, args.cards, args.seed, args.selection_ratio,
+                               args.files_per_folder, args.arw_size, args.dense)
+    print(f"Generated {args.files} shots on {args.cards} cards and {len(dataset['expected_matches'])} selected .jpg files in {args.root}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+# NumPy is optional; without it the window queries fall back to bisect on a plain int64 array
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+# Capture times closer than this count as the same shot (files without SubSecTimeOriginal only have whole seconds)
+EXACT_TOLERANCE_US = 1000000
+
+
+def to_epoch_us(creation_date):
+    return (creation_date.replace(tzinfo=None) - EPOCH) // ONE_MICROSECOND
+
+
+# Sorted capture-time index over all .arw files: epoch microseconds (int64) plus parallel path/name/date lists.
+# Files without a _DSC counter (renamed ones) have base_name None and are found by capture time only.
+class CaptureTimeIndex:
+    def __init__(self, arw_files):
+        entries = sorted((to_epoch_us(creation_date), arw_path, sys.intern(base_name) if base_name is not None else None, creation_date)
+                         for base_name, arw_path, creation_date in arw_files if creation_date is not None)
+        times = [entry[0] for entry in entries]
+        self.times = np.array(times, dtype=np.int64) if np is not None else array('q', times)
+        self.paths = [entry[1] for entry in entries]
+        self.base_names = [entry[2] for entry in entries]
+        self.dates = [entry[3] for entry in entries]
+        self.by_base_name = {}
+        for position, base_name in enumerate(self.base_names):
+            if base_name is None:
+                continue
+            if base_name not in self.by_base_name:
+                self.by_base_name[base_name] = []
+            self.by_base_name[base_name].append(position)
+
+    def __len__(self):
+        return len(self.paths)
+
+    # Function to return the [lo, hi) positions of all .arw files within max_time_difference of each target time
+    def window_batch(self, target_dates, max_time_difference):
+        window_us = int(max_time_difference * 1000000)
+        targets = [to_epoch_us(target_date) for target_date in target_dates]
+        if np is not None:
+            targets = np.array(targets, dtype=np.int64)
+            lows = np.searchsorted(self.times, targets - window_us, side='left')
+            highs = np.searchsorted(self.times, targets + window_us, side='right')
+            return list(zip(lows.tolist(), highs.tolist()))
+        return [(bisect_left(self.times, target - window_us), bisect_right(self.times, target + window_us))
+                for target in targets]
+
+    # Function to build the ranked candidate list: same base name first, then by time difference, then by path
+    def candidates(self, target_date, base_name, lo, hi):
+        target_us = to_epoch_us(target_date)
+        ranked = []
+        for position in range(lo, hi):
+            time_difference_us = abs(int(self.times[position]) - target_us)
+            same_name = base_name is not None and self.base_names[position] == base_name
+            ranked.append((not same_name, time_difference_us, self.paths[position], position))
+        ranked.sort()
+        return ranked
+
+    # Function to turn ranked candidates into the (arw_path, creation_date, time_difference) tuples shown to the user
+    def similar_files(self, ranked):
+        return [(self.paths[position], self.dates[position], time_difference_us / 1000000)
+                for _, time_difference_us, _, position in ranked]
+
+    def paths_for_base_name(self, base_name):
+        return [self.paths[position] for position in self.by_base_name.get(base_name, [])]
@@ -0,0 +1,224 @@
+import os
+import time
+import logging
+import threading
+from metadataIndex import DEFAULT_INDEX_PATH, open_index
+from metadataCache import DEFAULT_MAX_ENTRIES
+from scanEngine import DEFAULT_SCAN_CONCURRENCY, SCAN_ENGINES
+from copyBackend import COPY_MODES
+from copyScheduler import DEFAULT_MAX_INFLIGHT_MB, DEFAULT_READ_WORKERS, DEFAULT_WRITE_WORKERS
+from deviceScheduler import DEFAULT_PER_DEVICE_LIMIT
+from joinEngine import build_arw_index, plan_matches
+from previewHash import is_available as preview_hash_available, resolve_ambiguous
+from resolutionFile import DEFAULT_RESOLUTION_FILE_NAME, write_resolution_file
+from perfReport import DEFAULT_REPORT_FILE_NAME
+from integrity import discard_checksums
+from autoTune import DEFAULT_TUNING_PATH, AutoTuner
+from selectionWatcher import ADDED, DEFAULT_POLL_INTERVAL, REMOVED, RESYNC, create_watcher, is_selected_file
+from arwFinder_highPerformance import (autotune_scan, copy_arw_files, get_base_name, get_creation_date, log_missing_files, metadata_cache,
+                                       open_output_folder, perf_report, scan_arw_files, write_perf_report)
+
+WAIT_TIMEOUT = 0.5     # How often the loop checks the stop event
+DEBOUNCE_SECONDS = 0.05  # Events arriving this close together are handled as one batch
+
+
+# State of a watch session: which .arw file each selected .jpg was matched to, and the ambiguous selections
+class WatchSession:
+    def __init__(self, selected_jpg_folder, output_folder, arw_index, journal, manifest, log_file, index, options):
+        self.selected_jpg_folder = selected_jpg_folder
+        self.output_folder = output_folder
+        self.arw_index = arw_index
+        self.journal = journal
+        self.manifest = manifest
+        self.log_file = log_file
+        self.index = index
+        self.options = options
+        self.matched = {}    # jpg_file -> arw_path
+        self.ambiguous = {}  # jpg_file -> (jpg_file, jpg_path, jpg_creation_date, similar_files)
+        self.counts = {"selected": 0, "copied": 0, "skipped": 0, "failed": 0, "missing": 0, "removed": 0}
+
+    # Function to match newly selected .jpg files against the in-memory index and copy their .arw files
+    def add(self, jpg_files):
+        start = time.perf_counter()
+        plan = plan_matches(self.arw_index, jpg_files, self.selected_jpg_folder, get_creation_date, get_base_name)
+        if plan.ambiguous and self.options["auto_resolve"]:
+            resolved, plan.ambiguous = resolve_ambiguous(plan.ambiguous, self.options["num_workers"], self.index)
+            for jpg_file, jpg_path, jpg_creation_date, arw_path, distance in resolved:
+                logging.info(f"Matched {jpg_file} to {arw_path} automatically (preview hash distance {distance})")
+                plan.unique.append((jpg_file, jpg_path, jpg_creation_date, arw_path))
+        log_missing_files(plan.missing, self.log_file)
+        for jpg_file, _, _, reason in plan.missing:
+            print(f"{jpg_file}: {reason}")
+            self.ambiguous.pop(jpg_file, None)
+
+        arw_paths = [arw_path for _, _, _, arw_path in plan.unique]
+        copy_results = copy_arw_files(arw_paths, self.output_folder, self.log_file, self.options["copy_mode"],
+                                      self.options["read_workers"], self.options["write_workers"],
+                                      self.options["max_inflight_mb"], self.options["per_device_limit"],
+                                      self.journal, self.manifest, self.options["tuner"]) if arw_paths else []
+        results_by_source = {result.source_path: result for result in copy_results}
+        for jpg_file, _, _, arw_path in plan.unique:
+            self.ambiguous.pop(jpg_file, None)
+            result = results_by_source.get(arw_path)
+            if result is not None and result.error is None:
+                self.matched[jpg_file] = arw_path
+        self.log_file.flush()
+
+        ambiguous_changed = bool(plan.ambiguous)
+        for entry in plan.ambiguous:
+            self.ambiguous[entry[0]] = entry
+        if ambiguous_changed:
+            self.write_resolutions()
+
+        elapsed = time.perf_counter() - start
+        perf_report.record_file("watch", ", ".join(jpg_files[:3]) + (" ..." if len(jpg_files) > 3 else ""), elapsed, count=False)
+        copied = sum(1 for result in copy_results if result.error is None and result.method != "skipped")
+        skipped = sum(1 for result in copy_results if result.method == "skipped")
+        failed = sum(1 for result in copy_results if result.error is not None)
+        self.counts["selected"] += len(jpg_files)
+        self.counts["copied"] += copied
+        self.counts["skipped"] += skipped
+        self.counts["failed"] += failed
+        self.counts["missing"] += len(plan.missing)
+        print(f"{len(jpg_files)} selected: {copied} copied, {skipped} already present, {failed} failed, "
+              f"{len(plan.missing)} missing, {len(plan.ambiguous)} ambiguous ({elapsed:.2f} s)")
+
+    # Function to forget deselected .jpg files and, with remove_on_delete, remove the .arw files copied for them.
+    # An .arw file is only removed when the journal shows this tool copied it from the matched source and the copy is
+    # unchanged since, and no other selected .jpg still uses it.
+    def remove(self, jpg_files):
+        for jpg_file in jpg_files:
+            arw_path = self.matched.pop(jpg_file, None)
+            if self.ambiguous.pop(jpg_file, None) is not None:
+                self.write_resolutions()
+            if arw_path is None or not self.options["remove_on_delete"] or arw_path in self.matched.values():
+                continue
+            output_path = self.journal.destination_of(arw_path)
+            if output_path is None:
+                continue
+            entry = self.journal.get(output_path)
+            try:
+                output_stat = os.stat(output_path)
+            except OSError:
+                continue
+            if entry is None or entry["source"] != arw_path or \
+                    (output_stat.st_size, output_stat.st_mtime_ns) != (entry["size"], entry["mtime_ns"]):
+                log_message = f"Kept {output_path} after {jpg_file} was deselected: it was not copied by this tool or has changed\n"
+                self.log_file.write(log_message)
+                logging.warning(log_message)
+                continue
+            os.remove(output_path)
+            self.journal.forget(output_path)
+            if self.manifest is not None:
+                self.manifest.remove(output_path)
+            else:
+                discard_checksums(self.output_folder, [output_path])
+            self.counts["removed"] += 1
+            logging.info(f"Removed {output_path} after {jpg_file} was deselected")
+            print(f"{jpg_file} deselected: removed {os.path.basename(output_path)}")
+        self.log_file.flush()
+
+    def write_resolutions(self):
+        resolution_path = self.options["resolution_path"] or os.path.join(self.output_folder, DEFAULT_RESOLUTION_FILE_NAME)
+        write_resolution_file(resolution_path, [self.ambiguous[jpg_file] for jpg_file in sorted(self.ambiguous)], self.output_folder)
+        if self.ambiguous:
+            print(f"{len(self.ambiguous)} ambiguous selections written to {resolution_path}")
+
+    # Function to bring the session in line with the folder listing, after the watcher may have missed events
+    def resync(self):
+        current = {name for name in os.listdir(self.selected_jpg_folder) if is_selected_file(name)}
+        known = set(self.matched) | set(self.ambiguous)
+        self.remove(sorted(known - current))
+        added = sorted(current - known)
+        if added:
+            self.add(added)
+
+
+# Function to reduce a batch of watcher events to the files added and removed in the end (later events win)
+def net_changes(events):
+    latest = {}
+    resync = False
+    for kind, name in events:
+        if kind == RESYNC:
+            resync = True
+        else:
+            latest[name] = kind
+    added = sorted(name for name, kind in latest.items() if kind == ADDED)
+    removed = sorted(name for name, kind in latest.items() if kind == REMOVED)
+    return added, removed, resync
+
+
+# Function to run the watch daemon: scan the SD cards once, keep the .arw index in memory, copy the .arw file of every
+# .jpg already in (or later added to) the selection folder, and optionally remove it again when the .jpg is deleted.
+# Ambiguous selections are written to a resolution file. With autotune the scan is tuned as in run_job, while copies
+# only use settings remembered from earlier runs. Runs until stop_event is set or Ctrl+C; returns the counts.
+def watch_selection(selected_jpg_folder, sd_card_folders, output_folder, num_workers=8, scan_engine="thread",
+                    index_path=DEFAULT_INDEX_PATH, copy_mode="reflink", read_workers=DEFAULT_READ_WORKERS,
+                    write_workers=DEFAULT_WRITE_WORKERS, max_inflight_mb=DEFAULT_MAX_INFLIGHT_MB,
+                    per_device_limit=DEFAULT_PER_DEVICE_LIMIT, auto_resolve=True, verify=False,
+                    remove_on_delete=False, poll_interval=DEFAULT_POLL_INTERVAL, force_polling=False,
+                    resolution_path=None, cache_size=DEFAULT_MAX_ENTRIES, report_path=None, stop_event=None,
+                    scan_concurrency=DEFAULT_SCAN_CONCURRENCY, autotune=False, tuning_path=DEFAULT_TUNING_PATH,
+                    retune=False):
+    if scan_engine not in SCAN_ENGINES:
+        raise ValueError(f"Unknown scanning engine '{scan_engine}'. Choose one of: {', '.join(SCAN_ENGINES)}")
+    if copy_mode not in COPY_MODES:
+        raise ValueError(f"Unknown copy mode '{copy_mode}'. Choose one of: {', '.join(COPY_MODES)}")
+    selected_jpg_folder = os.path.abspath(selected_jpg_folder)
+    sd_card_folders = [os.path.abspath(folder) for folder in sd_card_folders]
+    output_folder = os.path.abspath(output_folder)
+    stop_event = stop_event or threading.Event()
+    metadata_cache.resize(cache_size)
+    perf_report.reset()
+    journal, manifest, log_file = open_output_folder(output_folder, verify, time.time())
+
+    tuner = AutoTuner(tuning_path, retune, probe_copies=False) if autotune or retune else None
+    scan_engine, num_workers, scan_per_device_limit, scan_concurrency = autotune_scan(
+        tuner, sd_card_folders, scan_engine, num_workers, per_device_limit, scan_concurrency)
+    print("\nPreloading metadata for .arw files...")
+    index = open_index(index_path)
+    arw_files = scan_arw_files(sd_card_folders, num_workers, scan_engine, index, scan_per_device_limit, scan_concurrency)
+    arw_index = build_arw_index(arw_files)
+    print(f"Indexed {len(arw_files)} .arw files; restart watch mode to pick up new SD cards")
+
+    options = {"num_workers": num_workers, "copy_mode": copy_mode, "read_workers": read_workers,
+               "write_workers": write_workers, "max_inflight_mb": max_inflight_mb, "per_device_limit": per_device_limit,
+               "auto_resolve": auto_resolve and preview_hash_available(), "remove_on_delete": remove_on_delete,
+               "resolution_path": resolution_path, "tuner": tuner}
+    session = WatchSession(selected_jpg_folder, output_folder, arw_index, journal, manifest, log_file, index, options)
+
+    # The watcher starts before the initial pass, so .jpg files selected meanwhile are not missed
+    watcher = create_watcher(selected_jpg_folder, poll_interval, force_polling)
+    try:
+        initial = sorted(name for name in os.listdir(selected_jpg_folder) if is_selected_file(name))
+        if initial:
+            session.add(initial)
+        print(f"\nWatching {selected_jpg_folder} for selected .jpg files (Ctrl+C to stop)...")
+        while not stop_event.is_set():
+            events = watcher.wait(WAIT_TIMEOUT)
+            if not events:
+                continue
+            # Gather events that arrive together (e.g. a multi-file drag and drop) into one batch
+            while True:
+                more = watcher.wait(DEBOUNCE_SECONDS)
+                if not more:
+                    break
+                events.extend(more)
+            added, removed, resync = net_changes(events)
+            if removed:
+                session.remove(removed)
+            if added:
+                session.add(added)
+            if resync:
+                session.resync()
+    except KeyboardInterrupt:
+        print("\nWatch mode stopped")
+    finally:
+        watcher.close()
+        if index is not None:
+            index.close()
+        log_file.close()
+        journal.close()
+    summary = dict(session.counts, ambiguous=len(session.ambiguous))
+    summary["report_file"] = write_perf_report(report_path or os.path.join(output_folder, DEFAULT_REPORT_FILE_NAME))
+    return summary
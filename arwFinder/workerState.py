@@ -0,0 +1,69 @@
+import threading
+
+DEFAULT_LOG_BATCH_SIZE = 64
+
+
+# Thread-safe list for results appended by worker threads
+class ResultCollector:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = []
+
+    def append(self, item):
+        with self.lock:
+            self.items.append(item)
+
+    def extend(self, items):
+        with self.lock:
+            self.items.extend(items)
+
+    # Function to take all collected items, leaving the collector empty
+    def drain(self):
+        with self.lock:
+            items, self.items = self.items, []
+        return items
+
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.items))
+
+
+# Log file wrapper shared by worker threads: writes are buffered under a lock and flushed to the file in batches,
+# so workers do not contend on the file handle. Closing (or leaving the with block) flushes what is left.
+class BatchedLogWriter:
+    def __init__(self, log_file, batch_size=DEFAULT_LOG_BATCH_SIZE):
+        self.log_file = log_file
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = []
+
+    def write(self, message):
+        with self.lock:
+            self.pending.append(message)
+            if len(self.pending) >= self.batch_size:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self.pending:
+            self.log_file.write("".join(self.pending))
+            self.pending = []
+        self.log_file.flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def close(self):
+        with self.lock:
+            self._flush_locked()
+            self.log_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()